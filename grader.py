@@ -0,0 +1,4 @@
+from web.grading import run_worker
+
+if __name__ == '__main__':
+    run_worker()
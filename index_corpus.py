@@ -0,0 +1,18 @@
+import argparse
+
+from web import app
+from web.corpus import update_corpus, import_archive
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add submissions to the plagiarism corpus index.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('update', help='add the results missing from the corpus, from every session')
+    archive = commands.add_parser('import', help='add the python files of a directory of historic solutions')
+    archive.add_argument('directory')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.command == 'update':
+            print(f'Added {update_corpus()} results')
+        else:
+            print(f'Added {import_archive(args.directory)} files')
@@ -0,0 +1,60 @@
+"""Benchmark the winnowing step on the plagiarism/tests corpus scaled up.
+
+Compares generate_fingerprints with the previous implementation, which looked for the minimum of
+every window from scratch. Run from this folder: python benchmark_fingerprints.py
+"""
+import os
+import glob
+import timeit
+import collections
+
+from winnowing import token_text, hash_into_num, kgrams, generate_fingerprints
+
+SCALES = [1, 10, 100]
+REPEAT = 3
+
+
+def generate_fingerprints_naive(arr, window_size=4):
+    """Previous implementation of generate_fingerprints, O(n * window size)."""
+    queue = collections.deque(arr[:window_size])
+
+    def get_min_ind(a):
+        return len(a) - 1 - a[::-1].index(min(a))
+
+    m_ind = get_min_ind(list(queue))
+    fingerprints = [(min(queue), m_ind)]
+    visited = set([m_ind])
+
+    for i in range(len(arr) - window_size):
+        queue.popleft()
+        queue.append(arr[i + window_size])
+
+        min_ind = i + get_min_ind(list(queue)) + 1
+        if min_ind not in visited:
+            fingerprints.append((min(queue), min_ind))
+            visited.add(min_ind)
+
+    return fingerprints
+
+
+def load_hashes(k=12):
+    """Hash the k-grams of every file of the corpus."""
+    hashes = []
+    for filename in sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'tests', '*.py'))):
+        with open(filename, 'r') as f:
+            tokens, _ = token_text(f.read())
+        hashes += list(map(hash_into_num, kgrams(''.join(t[0] for t in tokens), k)))
+    return hashes
+
+
+if __name__ == '__main__':
+    corpus = load_hashes()
+
+    print(f"{'hashes':>10} {'naive (s)':>12} {'deque (s)':>12} {'speedup':>8}")
+    for scale in SCALES:
+        hashes = corpus * scale
+        assert generate_fingerprints(hashes) == generate_fingerprints_naive(hashes)
+
+        naive = min(timeit.repeat(lambda: generate_fingerprints_naive(hashes), number=1, repeat=REPEAT))
+        deque = min(timeit.repeat(lambda: generate_fingerprints(hashes), number=1, repeat=REPEAT))
+        print(f"{len(hashes):>10} {naive:>12.4f} {deque:>12.4f} {naive / deque:>7.1f}x")
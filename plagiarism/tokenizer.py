@@ -6,27 +6,52 @@ def preprocess(s):
     return s.replace(' ', '').replace('\n', '').replace('#', '').replace('\"', '')
 
 
-def edit_distance(s1, s2):
-    """Apply levenshtein distance to determine the edit distance between two comment strings."""
-
-    # Initialize dp
-    dp = [[0] * (len(s2) + 1) for _ in range(len(s1) + 1)]
-
-    for i in range(len(dp)):
-        for j in range(len(dp[0])):
-            if i == 0 and j == 0:
-                continue
-            elif i == 0:
-                dp[i][j] = dp[i][j - 1] + 1
-            elif j == 0:
-                dp[i][j] = dp[i - 1][j] + 1
-            else:
-                if s1[i - 1] == s2[j - 1]:
-                    dp[i][j] = dp[i - 1][j - 1]
-                else:
-                    dp[i][j] = min(dp[i - 1][j - 1], dp[i][j - 1], dp[i - 1][j]) + 1
-
-    return dp[-1][-1]
+def edit_distance(s1, s2, max_distance=None):
+    """Apply levenshtein distance to determine the edit distance between two comment strings.
+
+    Uses Myers' bit-parallel algorithm: a column of the DP table is kept as bit vectors of its
+    vertical differences in python integers, one bit per character of the shorter string. Stops
+    early once the distance can't be at most 'max_distance' anymore and returns the lower bound
+    reached at that point, which is larger than 'max_distance'.
+    """
+    # The shorter string is the pattern encoded in bits.
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+    if not s1:
+        return len(s2)
+
+    # Positions of every character in the pattern.
+    peq = {}
+    for i, c in enumerate(s1):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    mask = (1 << len(s1)) - 1
+    last = 1 << (len(s1) - 1)
+    pv, mv, score = mask, 0, len(s1)
+
+    for j, c in enumerate(s2):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+
+        # The first row of the table increases by one with every character.
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+
+        # The distance decreases by at most one per remaining character.
+        if max_distance is not None and score - (len(s2) - j - 1) > max_distance:
+            return score - (len(s2) - j - 1)
+
+    return score
 
 
 def comment_edit_distance(filename1, filename2):
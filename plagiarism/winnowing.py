@@ -48,24 +48,30 @@ def kgrams(text, k):
 
 
 def generate_fingerprints(arr, window_size=4):
-    """Generate fingerprints for a list of hashed values."""
-    queue = collections.deque(arr[:window_size])
-
-    def get_min_ind(a):
-        return len(a) - 1 - a[::-1].index(min(a))
-
-    m_ind = get_min_ind(list(queue))
-    fingerprints = [(min(queue), m_ind)]
-    visited = set([m_ind])
-
-    for i in range(len(arr) - window_size):
-        queue.popleft()
-        queue.append(arr[i + window_size])
-
-        min_ind = i + get_min_ind(list(queue)) + 1
-        if min_ind not in visited:
-            fingerprints.append((min(queue), min_ind))
-            visited.add(min_ind)
+    """Generate fingerprints for a list of hashed values.
+
+    The minimum of every window of hashes is selected, the rightmost one on ties, and recorded once
+    as (hash, index). Indices of the candidate minimums are kept in a deque of increasing hashes so
+    each hash is pushed and popped at most once.
+    """
+    candidates = collections.deque()
+    fingerprints = []
+
+    for i, h in enumerate(arr):
+        # Hashes larger or equal to the new one can't be the rightmost minimum of any window anymore.
+        while candidates and arr[candidates[-1]] >= h:
+            candidates.pop()
+        candidates.append(i)
+
+        # Wait for the first window to fill up, unless there are fewer hashes than a window.
+        if i < window_size - 1 and i < len(arr) - 1:
+            continue
+
+        if candidates[0] <= i - window_size:
+            candidates.popleft()
+
+        if not fingerprints or fingerprints[-1][1] != candidates[0]:
+            fingerprints.append((arr[candidates[0]], candidates[0]))
 
     return fingerprints
 
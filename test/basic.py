@@ -18,6 +18,8 @@ class FlaskTestCase(unittest.TestCase):
         app.config['TESTING'] = True
         app.config['WTF_CSRF_ENABLED'] = False
         app.config['DEBUG'] = False
+        app.config['PLAGIARISM_PRECOMPUTE'] = False
+        app.config['CORPUS_INCREMENTAL'] = False
 
         db.create_all()
 
@@ -1,8 +1,11 @@
 import io
 import json
+import glob
 import unittest
 from test.basic import FlaskTestCase
 
+from web.models import Result  # noqa
+
 
 class TestAPICase(FlaskTestCase):
 
@@ -27,6 +30,37 @@ class TestAPICase(FlaskTestCase):
 
         self.assertEqual(response.status_code, 200)
 
+    # Test apis nearest results.
+    def test_apis_nearest(self):
+        self.upload_file()
+        rid_1 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        with open(glob.glob('malicious/plagiarism_test_*.py')[0], 'r') as file:
+            self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(file.read().encode()), 'test.py')), follow_redirects=True)
+
+        self.logout()
+        self.login_as_student()
+        self.app.get('/register/join156', follow_redirects=True)
+
+        with open('sample.py', 'r') as file:
+            self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(file.read().encode()), 'test.py')), follow_redirects=True)
+        rid_2 = Result.query.filter_by(user_id=2).all()[-1].id
+
+        credentials = {"email": "example_admin_user@gmail.com", "password": "111"}
+        response = self.app.post(f'/apis/nearest/{rid_1}', data = json.dumps({"credentials": credentials, "k": 5}), content_type='application/json')
+
+        # Other submissions of the same user are left out.
+        self.assertEqual(response.json['data']['neighbours'], [{'result_id': rid_2, 'email': 'example_user@gmail.com', 'similarity': 1.0}])
+
+        response = self.app.post(f'/apis/nearest/{rid_1}', data = json.dumps({"credentials": credentials, "k": 0}), content_type='application/json')
+        self.assertEqual(response.json['data']['neighbours'], [])
+
+        # Bad parameters get an error message instead of failing.
+        for parameters in ({"k": "ten"}, {"k": -1}, {"threshold": 2}, {"threshold": None}):
+            response = self.app.post(f'/apis/nearest/{rid_1}', data = json.dumps(dict(parameters, credentials=credentials)), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            assert 'neighbours' not in response.json['data'] and response.json['data']['message']
+
 
 if __name__ == '__main__':
     unittest.main()
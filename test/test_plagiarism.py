@@ -1,9 +1,29 @@
 import io
+import ast
 import glob
+import itertools
+import time
+import shutil
+import tempfile
 import unittest
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from test.basic import FlaskTestCase
 
+from web import app, db  # noqa
+
 from web.models import Result  # noqa
+from web.fingerprints import match_result, session_matches  # noqa
+from web.winnowing import winnowing, hash_kgrams  # noqa
+from web.tokens import get_tokens, comment_text  # noqa
+from web.trees import canonical_form, label_tree, find_copies, EXACT, UNIFYING, IGNORING  # noqa
+from web.subtrees import hash_subtrees, match_subtrees, session_shared_subtrees  # noqa
+from web.plagiarism import Plagiarism, comment_similarity  # noqa
+from web.sketches import sketch_tree, load_sketch, estimate_similarity, sketch_bands, NUM_BANDS  # noqa
+from web import report  # noqa
+from web.report import session_report  # noqa
+from web import corpus  # noqa
+from web.corpus import update_corpus, import_archive, match_corpus, load_segments, indexed_results  # noqa
 
 
 class TestPlagiarismCase(FlaskTestCase):
@@ -52,6 +72,343 @@ class TestPlagiarismCase(FlaskTestCase):
         assert "<td>Ignorevariables</td><td>True</td>" in processed  # verify whether ignore variables test passed
         assert "<td>ExactMatch</td><td>False</td>" in processed  # verify whether exact match test failed
 
+        # Both files have the same structure and are compared against each other.
+        response = self.app.get(f'/compare/{rid_1}', follow_redirects=True)
+        assert response.status_code == 200
+        assert f"/compare/{rid_1}/{rid_2}" in response.data.decode('utf-8')
+        assert "(estimated)" not in response.data.decode('utf-8')
+        assert f"Shared Fingerprints: {match_result(Result.query.get(rid_1)).get(rid_2, 0)}" in response.data.decode('utf-8')
+
+        # Results below the top ones only get the similarity estimated from their sketches.
+        response = self.app.get(f'/compare/{rid_1}?top=0', follow_redirects=True)
+        assert "- 1.0 (estimated)" in response.data.decode('utf-8')
+
+    # Test the pruning of tree distances below the threshold.
+    def test_tree_distance_threshold(self):
+        self.upload_file()
+        rid_1 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        with open(glob.glob('malicious/plagiarism_test_*.py')[0], 'r') as file:
+            to_test = file.read()
+
+        self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
+        rid_2 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        p = Plagiarism(rid_1, rid_2)
+        similarity = p.tree_distance()
+
+        # The bound returned instead of the similarity is never lower than it.
+        assert p.tree_distance(threshold=0.99) >= similarity
+        assert p.tree_distance(threshold=similarity) == similarity
+        assert Plagiarism(rid_1, rid_1).tree_distance(threshold=1.0) == 1.0
+
+    # Test the session-wide plagiarism report.
+    def test_plagiarism_session(self):
+        self.upload_file()
+        rid_1 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        self.logout()
+        self.login_as_student()
+        self.app.get('/register/join156', follow_redirects=True)
+
+        to_test = ''
+        with open('sample.py', 'r') as file:
+            for line in file:
+                to_test += line
+
+        self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
+        rid_2 = Result.query.filter_by(user_id=2).all()[-1].id
+
+        # Identical submissions share all of their fingerprints.
+        assert match_result(Result.query.get(rid_1))[rid_2] > 0
+
+        self.logout()
+        self.login_as_admin()
+
+        response = self.app.get('/plagiarism/1', follow_redirects=True)
+        processed = response.data.decode('utf-8').replace(" ", "").replace("\n", "")
+
+        assert "FingerprintOverlap:1.0" in processed
+        assert "ExactMatch" in processed
+
+        # The functions of each submission are found in the other one.
+        assert 'FunctionDef:bubble_sort' in match_subtrees(Result.query.get(rid_1))[rid_2]
+        assert "SharedBlocks:8" in processed
+
+        # Both latest submissions are grouped as exact copies.
+        assert find_copies(1) == [[rid_1, rid_2]]
+        assert "ExactCopies" in processed
+
+    # Test the boilerplate left out of session-wide matching.
+    def test_session_matches_frequency(self):
+        with open('sample.py', 'r') as file:
+            to_test = file.read()
+
+        for user_id in range(1, 11):
+            db.session.add(Result(user_id=user_id, email=f'user_{user_id}@gmail.com', session_id=1, content=to_test))
+        db.session.commit()
+        results = Result.query.order_by(Result.id).all()
+
+        # Three students sharing copied code in a small session.
+        rids = [result.id for result in results[:3]]
+        overlaps = session_matches(1, results[:3])
+        assert overlaps == {pair: 1.0 for pair in itertools.combinations(rids, 2)}
+        assert set(session_shared_subtrees(1, results[:3])) == set(overlaps)
+
+        # In a large enough session, code shared by most of the results is boilerplate.
+        assert session_matches(1, results) == {}
+        assert session_shared_subtrees(1, results) == {}
+
+    # Test the line ranges matched by winnowing.
+    def test_winnowing(self):
+        with open('sample.py', 'r') as file:
+            to_test = file.read()
+
+        i1, i2, r1, r2 = winnowing(to_test, to_test)
+
+        # Both copies match on the same lines.
+        assert i1 == i2 and r1 == r2 and r1 > 0
+        assert all(0 < start <= end for start, end in i1)
+
+        _, _, r1, _ = winnowing(to_test, "def f(x):\n    return x\n" * 3)
+        assert r1 == 0
+
+    # Test the hashing of k grams.
+    def test_hash_kgrams(self):
+        hashes = hash_kgrams("abcdefabcdefx", 6)
+
+        assert len(hashes) == 7
+        assert hashes[0] == hashes[6] and len(set(hashes[:6])) == 6
+        assert all(0 <= h < 2 ** 32 for h in hashes)
+        assert hash_kgrams("abc", 6) == []
+
+    # Test the tokens stored with results.
+    def test_result_tokens(self):
+        self.upload_file()
+        result = Result.query.filter_by(user_id=1).all()[-1]
+
+        # Results are tokenized once when graded.
+        assert result.tokens is not None
+
+        tokens = get_tokens(result)
+        assert tokens['lines'] > 0 and tokens['tokens']
+        assert tokens['comments'] == comment_text(result.content)
+
+        assert comment_text("x = 1  # first one\ny = 'two'\n") == "firstone'two'"
+
+    # Test the canonical forms of the views of an AST.
+    def test_canonical_form(self):
+        tree_1 = ast.parse("def add(a, b):\n    return a + b\n")
+        tree_2 = ast.parse("def add(x, y):\n    return x + y\n")
+        tree_3 = ast.parse("def add(x, y):\n    return y + x\n")
+
+        assert canonical_form(tree_1, EXACT) != canonical_form(tree_2, EXACT)
+        assert canonical_form(tree_1, UNIFYING) == canonical_form(tree_2, UNIFYING)
+        assert canonical_form(tree_1, UNIFYING) != canonical_form(tree_3, UNIFYING)
+        assert canonical_form(tree_1, IGNORING) == canonical_form(tree_3, IGNORING)
+
+    # Test the hashes of subtrees.
+    def test_hash_subtrees(self):
+        subtrees_1 = hash_subtrees(ast.parse("def f(xs):\n    total = 0\n    for x in xs:\n        total += x * x\n    return total\n"))
+        subtrees_2 = hash_subtrees(ast.parse("def g(ys):\n    acc = 0\n    for y in ys:\n        acc += y * y\n    return acc\n"))
+
+        # Only the function is large enough to be indexed, and it only matches once normalized.
+        assert [type(node).__name__ for _, _, node, _ in subtrees_1] == ['FunctionDef']
+        assert subtrees_1[0][0] != subtrees_2[0][0]
+        assert subtrees_1[0][1] == subtrees_2[0][1]
+
+    # Test the estimation of tree similarities from sketches.
+    def test_sketches(self):
+        sketches = []
+        for filename in sorted(glob.glob('malicious/plagiarism_test_*.py')) + ['sample.py']:
+            with open(filename, 'r') as file:
+                sketches.append(load_sketch(sketch_tree(label_tree(ast.parse(file.read())))))
+
+        # Renamed variables don't change the sketch.
+        assert estimate_similarity(sketches[0], sketches[1]) == 1.0
+        assert estimate_similarity(sketches[0], sketches[2]) < 0.5
+
+        # Similar sketches share bands, which are indexed to find candidates.
+        bands = [sketch_bands(sketch.tobytes()) for sketch in sketches]
+        assert bands[0] == bands[1] and len(bands[0]) == NUM_BANDS
+        assert sum(b0 == b2 for b0, b2 in zip(bands[0], bands[2])) < NUM_BANDS // 2
+
+    # Test the edit distance of comments.
+    def test_edit_distance(self):
+        self.upload_file()
+        result = Result.query.filter_by(user_id=1).all()[-1]
+        p = Plagiarism(result, result)
+
+        assert p.edit_distance("kitten", "sitting") == 3
+        assert p.edit_distance("", "abc") == p.edit_distance("abc", "") == 3
+        assert p.edit_distance("a" * 70 + "b", "b" + "a" * 70) == 2
+
+        # Stops once the distance is known to be larger than the maximum one.
+        assert 1 < p.edit_distance("abcdef", "uvwxyz", max_distance=1) <= 6
+        assert p.edit_distance("kitten", "sitting", max_distance=3) == 3
+
+        # Comment similarities of at least the threshold are exact, the ones below are upper bounds.
+        assert comment_similarity("abc" * 30, "abd" * 30, threshold=0.5) == comment_similarity("abc" * 30, "abd" * 30)
+        assert comment_similarity("a" * 90 + "b" * 10, "a" * 100, threshold=0.9) == 0.9
+        assert 0 < comment_similarity("a" * 100, "b" * 100, threshold=0.9) < 0.9
+
+        # The report stops computing them below its threshold.
+        described = [{'views': [None] * 3, 'tree': None, 'comments': c * 100} for c in "ab"]
+        assert 0 < report.compare_pair(*described, threshold=0.9)['comment_edit_distance'] < 0.9
+
+    # Test the session report computed over a pool of processes.
+    def test_session_report(self):
+        self.upload_file()
+
+        with open(glob.glob('malicious/plagiarism_test_*.py')[0], 'r') as file:
+            to_test = file.read()
+
+        self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
+        self.upload_file()
+        results = Result.query.filter_by(user_id=1).all()
+
+        serial = session_report(results, processes=1)
+        assert list(serial) == [(results[0].id, results[1].id), (results[0].id, results[2].id),
+                                (results[1].id, results[2].id)]
+        assert serial[(results[0].id, results[2].id)]['exact_match']
+
+        # Comparisons are stored once per pair, with the lowest result id first.
+        rows = report.Plagiarism.query.all()
+        assert sorted((row.first_result_id, row.second_result_id) for row in rows) == sorted(serial)
+
+        # Stored comparisons are reused, even for a higher threshold.
+        compare_pair = report.compare_pair
+        try:
+            report.compare_pair = None
+            assert session_report(results[::-1], threshold=0.5)[(results[2].id, results[0].id)] == \
+                serial[(results[0].id, results[2].id)]
+        finally:
+            report.compare_pair = compare_pair
+
+        report.Plagiarism.query.delete()
+        minimum = report.MIN_PARALLEL_PAIRS
+        try:
+            report.MIN_PARALLEL_PAIRS = 0
+            assert session_report(results, processes=2) == serial
+        finally:
+            report.MIN_PARALLEL_PAIRS = minimum
+
+        # Comparisons stored by an older version are computed again.
+        report.Plagiarism.query.update({'version': report.PLAGIARISM_VERSION - 1})
+        assert session_report(results, processes=1) == serial
+        assert {row.version for row in report.Plagiarism.query.all()} == {report.PLAGIARISM_VERSION}
+
+    # Test the comparisons of graded results in the background.
+    def test_schedule_comparisons(self):
+        self.upload_file()
+        rid_1 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        self.logout()
+        self.login_as_student()
+        self.app.get('/register/join156', follow_redirects=True)
+
+        with open('sample.py', 'r') as file:
+            to_test = file.read()
+
+        # Keep the background thread busy while the student submits twice.
+        running = threading.Event()
+        blocked = report._background_executor.submit(running.wait)
+        app.config['PLAGIARISM_PRECOMPUTE'] = True
+        try:
+            for _ in range(2):
+                self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
+
+            rids = [result.id for result in Result.query.filter_by(user_id=2).all()]
+
+            # Only the latest submission of the student is compared.
+            assert report._scheduled == {(1, 2): rids[-1]}
+        finally:
+            app.config['PLAGIARISM_PRECOMPUTE'] = False
+            running.set()
+
+        blocked.result()
+        report._background_executor.submit(lambda: None).result()
+
+        rows = report.Plagiarism.query.all()
+        assert [(row.first_result_id, row.second_result_id) for row in rows] == [(rid_1, rids[-1])]
+        assert rows[0].exact_match and not report._scheduled
+
+    # Test the corpus index of all sessions and archives.
+    def test_corpus(self):
+        self.upload_file()
+        rid_1 = Result.query.filter_by(user_id=1).all()[-1].id
+
+        with open('sample.py', 'r') as file:
+            to_test = file.read()
+
+        # The same code submitted in another session.
+        db.session.add(Result(user_id=2, email='example_user@gmail.com', session_id=2, content=to_test))
+        db.session.commit()
+        rid_2 = Result.query.filter_by(user_id=2).all()[-1].id
+
+        directory, archive = tempfile.mkdtemp(), tempfile.mkdtemp()
+        corpus_dir, max_segments = app.config['CORPUS_DIR'], corpus.MAX_SEGMENTS
+        try:
+            app.config['CORPUS_DIR'] = directory
+            for filename in ['sample.py'] + glob.glob('malicious/plagiarism_test_*.py'):
+                shutil.copy(filename, archive)
+
+            assert update_corpus() == 2 and update_corpus() == 0
+
+            corpus.MAX_SEGMENTS = 1
+            assert import_archive(archive) == 3
+            assert len(load_segments()) == 1
+
+            # Results of the same session are left out, they are matched by the session-wide index.
+            matches = match_corpus(Result.query.get(rid_1))
+            assert {document.get('result_id') for _, document in matches} == {rid_2, None}
+            assert [document.get('path') for overlap, document in matches if overlap == 1.0] == [None, 'sample.py']
+
+            response = self.app.get(f'/compare/{rid_1}', follow_redirects=True)
+            assert f"/compare/{rid_1}/{rid_2}" in response.data.decode('utf-8')
+            assert "Other Sessions and Archives" in response.data.decode('utf-8')
+
+            # New submissions are added in the background once graded.
+            app.config['CORPUS_INCREMENTAL'] = True
+            try:
+                self.upload_file()
+            finally:
+                app.config['CORPUS_INCREMENTAL'] = False
+
+            corpus._background_executor.submit(lambda: None).result()
+            assert Result.query.filter_by(user_id=1).all()[-1].id in indexed_results()
+        finally:
+            app.config['CORPUS_DIR'], corpus.MAX_SEGMENTS = corpus_dir, max_segments
+            shutil.rmtree(directory)
+            shutil.rmtree(archive)
+
+    # Test reading the corpus while it is written to.
+    def test_corpus_lock(self):
+        directory, archive = tempfile.mkdtemp(), tempfile.mkdtemp()
+        corpus_dir = app.config['CORPUS_DIR']
+        try:
+            app.config['CORPUS_DIR'] = directory
+            shutil.copy('sample.py', archive)
+            import_archive(archive)
+            segment = load_segments()[0]
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                with corpus.locked():
+                    # The segment is merged into a new one, the old one is still there.
+                    corpus.write_segment([segment.describe(0)], segment.fingerprints())
+                    loading = [executor.submit(load_segments) for _ in range(4)]
+                    time.sleep(0.2)
+                    assert not any(future.done() for future in loading)
+
+                    segment.remove()
+
+                # Readers only see the corpus once it is written, whatever the threads loading it.
+                assert all(len(future.result()) == 1 for future in loading)
+        finally:
+            app.config['CORPUS_DIR'] = corpus_dir
+            shutil.rmtree(directory)
+            shutil.rmtree(archive)
+
 
 if __name__ == '__main__':
     unittest.main()
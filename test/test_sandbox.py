@@ -0,0 +1,48 @@
+import unittest
+from test.basic import FlaskTestCase
+
+from base import BaseTest  # noqa
+from sandbox import pool  # noqa
+
+
+class TestSandboxCase(FlaskTestCase):
+
+    # Test cases sharing their parameters.
+    def test_shared_parameters(self):
+        cases = [([4, 3, 5, 2],), ([5, 4, 3, 2],)]
+        answers = [[2, 3, 4, 5], [2, 3, 4, 5]]
+        code = "def bubble_sort(a):\n    a.sort()\n    return a\n\ndef selection_sort(a):\n    return a\n"
+
+        test = BaseTest.from_fixtures(code, {'bubble_sort': cases, 'selection_sort': cases},
+                                      {'bubble_sort': answers, 'selection_sort': answers})
+        result = test.test(runtime=1.0, blacklist=[])
+
+        # Sorting the parameters in place doesn't sort them for the other function.
+        assert all(outcome == "Passed" for outcome in result['bubble_sort'].values())
+        assert all(outcome.startswith("Wrong Answer") for outcome in result['selection_sort'].values())
+
+    # Test a case timing out.
+    def test_timeout(self):
+        cases = [([4, 3, 5, 2],), ([5, 4, 3, 2],), ([4, 5, 3, 2],)]
+        code = "def bubble_sort(a):\n    while a[0] == 5:\n        pass\n    return sorted(a)\n"
+
+        test = BaseTest.from_fixtures(code, {'bubble_sort': cases}, {'bubble_sort': [[2, 3, 4, 5]] * 3})
+        result = test.test(runtime=0.5, blacklist=[])
+
+        # The cases after the one timing out run on a fresh worker.
+        self.assertEqual(list(result['bubble_sort'].values()), ["Passed", "Time Out", "Passed"])
+
+    # Test recycling the worker of a lease ending with an exception.
+    def test_lease_exception(self):
+        try:
+            with pool.lease() as worker:
+                pid = worker.process.pid
+                raise RuntimeError("interrupted")
+        except RuntimeError:
+            pass
+
+        assert worker.is_alive() and worker.process.pid != pid
+
+
+if __name__ == '__main__':
+    unittest.main()
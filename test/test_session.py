@@ -1,6 +1,9 @@
+import io
 import unittest
 from test.basic import FlaskTestCase
 
+from web.models import Session  # noqa
+
 
 class TestSessionCase(FlaskTestCase):
 
@@ -14,6 +17,24 @@ class TestSessionCase(FlaskTestCase):
         response = self.create_session()
         self.assertEqual(response.status_code, 200)
 
+    # Test that the evaluated parameters and answers are stored with a new session.
+    def test_create_session_fixtures(self):
+        self.login_as_admin()
+
+        to_test = ''
+        with open('sample_test.py', 'r') as file:
+            for line in file:
+                to_test += line
+
+        self.app.post('/upload_session', data = dict(filename=(io.BytesIO(to_test.encode()), 'test_sample.py'), description="test", session_num=2.1, course_num="CS156", runtime=1.0), follow_redirects=True)
+
+        session = Session.query.filter_by(session_num=2.1).first()
+        assert session.fixtures is not None
+
+        dummy = session.get_test_cases()
+        self.assertEqual(list(dummy.parameters.keys()), ['bubble_sort', 'selection_sort'])
+        self.assertEqual(dummy.answers['bubble_sort'][0], [2, 3, 4, 5])
+
     # Test delete session.
     def test_delete_session(self):
         self.create_session()
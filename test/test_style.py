@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+from test.basic import FlaskTestCase
+
+from web.utils import check_style  # noqa
+
+
+class TestStyleCase(FlaskTestCase):
+
+    def run_flake8(self, code, rules_to_ignore):
+        """Get the warnings of the flake8 command on code as returned by check_style, None if it crashed."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.py')
+            with open(path, 'w') as file:
+                file.write(code)
+
+            process = subprocess.run(
+                [sys.executable, "-m", "flake8", f"--ignore={','.join(rules_to_ignore)}",
+                 "--format=%(row)d:%(col)d:%(code)s:%(text)s", path],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+        # flake8 3.8 crashes on the syntax errors of Python 3.10 and later, which carry their end position.
+        if "Traceback" in process.stderr:
+            return None
+
+        warnings = []
+        for line in process.stdout.splitlines():
+            row, col, code, text = line.split(':', 3)
+            warnings.append((int(row), int(col), code, text))
+        return warnings
+
+    def assert_same_as_flake8(self, code, rules_to_ignore=("W191",)):
+        expected = self.run_flake8(code, rules_to_ignore)
+        self.assertEqual(check_style(code, list(rules_to_ignore)), expected)
+        return expected
+
+    # Test code without any warning.
+    def test_clean(self):
+        self.assertEqual(self.assert_same_as_flake8("import os\n\nprint(os.sep)\n"), [])
+
+    # Test pycodestyle and pyflakes warnings together.
+    def test_warnings(self):
+        code = "import os\nimport sys\nx=1\ndef f( a ):\n    return b\n"
+        codes = [code for _, _, code, _ in self.assert_same_as_flake8(code)]
+        assert {"F401", "E225", "E302", "E201", "E202", "F821"} <= set(codes)
+
+    # Test '# noqa' ignoring every warning of its line.
+    def test_noqa(self):
+        code = "import os  # noqa\nimport sys  # NOQA\nx=1 # noqa\ny=2\n"
+        warnings = self.assert_same_as_flake8(code)
+        assert all(row == 4 for row, _, _, _ in warnings)
+
+    # Test '# noqa: CODE' only ignoring the listed codes.
+    def test_noqa_codes(self):
+        code = ("import os  # noqa: F401\n"
+                "import sys  # noqa: E501\n"
+                "x=1  # noqa:E225,F401\n"
+                "y=(1 , 2)  # noqa: E2\n"
+                "z=3  # noqa: W291\n")
+        warnings = self.assert_same_as_flake8(code)
+        self.assertEqual(sorted({row for row, _, _, _ in warnings}), [2, 5])
+
+    # Test a syntax error stopping the checks.
+    def test_syntax_error(self):
+        code = "x=1\ndef f(a b):\n    pass\nimport os\n"
+        try:
+            compile(code, "<inline code>", "exec")
+        except SyntaxError as e:
+            error = e
+
+        warnings = check_style(code, ["W191"])
+        self.assertEqual(warnings, [(1, 2, "E225", "missing whitespace around operator"),
+                                    (error.lineno, error.offset, "E999", f"SyntaxError: {error.msg}")])
+        self.assertEqual(check_style(code, ["W191", "E999"]), warnings[:1])
+
+        expected = self.run_flake8(code, ["W191"])
+        if expected is not None:
+            self.assertEqual(warnings, expected)
+
+    # Test code which can't even be tokenized.
+    def test_token_error(self):
+        for code in ("x=1\nimport os\ny = (1,\n", "x=1\ny = \"\"\"abc\n", "x = 1   \ny = (1,   \n  2,   \n",
+                     "if x:\n        y = 1   \n    z = 2\n"):
+            codes = [code for _, _, code, _ in self.assert_same_as_flake8(code)]
+            assert "E902" in codes and "E999" not in codes
+
+    # Test the W191 tab indentation warning ignored by flake8_test.
+    def test_tabs(self):
+        code = "def f(a):\n\tif a:\n\t\treturn 1\n\treturn 2\n"
+        self.assertEqual(self.assert_same_as_flake8(code), [])
+
+        codes = [code for _, _, code, _ in self.assert_same_as_flake8(code, ())]
+        assert "W191" in codes
+
+
+if __name__ == '__main__':
+    unittest.main()
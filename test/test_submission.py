@@ -1,8 +1,16 @@
 import io
 import glob
 import unittest
+from datetime import datetime, timedelta
 from test.basic import FlaskTestCase
 
+from web import app, db  # noqa
+from web.models import Result  # noqa
+from web import grading  # noqa
+from web.grading import grade_next, requeue_expired  # noqa
+from web.highlight import highlight_lines  # noqa
+from web.trees import AST_VERSION  # noqa
+
 
 class TestSubmissionCase(FlaskTestCase):
 
@@ -24,6 +32,97 @@ class TestSubmissionCase(FlaskTestCase):
             response = self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
             assert "Passed Test Cases: 3 / 3" not in str(response.data)
 
+    # Test submitting files through the grading queue.
+    def test_upload_file_async(self):
+        app.config['GRADING_ASYNC'] = True
+        try:
+            response = self.upload_file()
+        finally:
+            app.config['GRADING_ASYNC'] = False
+
+        assert "Your submission is being graded" in str(response.data)
+
+        rid = Result.query.filter_by(user_id=1).all()[-1].id
+        response = self.app.get(f'/apis/result/{rid}')
+        self.assertEqual(response.json['data']['status'], 'pending')
+
+        assert grade_next()
+        assert not grade_next()
+
+        response = self.app.get(f'/apis/result/{rid}')
+        self.assertEqual(response.json['data']['status'], 'done')
+        self.assertEqual(response.json['data']['success'], True)
+
+        response = self.app.get(f'/summary_result/{rid}', follow_redirects=True)
+        assert "Congratulations! You passed all test cases!" in str(response.data)
+
+    # Test viewing a result graded before its report was stored.
+    def test_summary_result_without_report(self):
+        self.upload_file()
+
+        result = Result.query.filter_by(user_id=1).all()[-1]
+        result.report = None
+        db.session.commit()
+
+        response = self.app.get(f'/summary_result/{result.id}', follow_redirects=True)
+        assert "Congratulations! You passed all test cases!" in str(response.data)
+        assert Result.query.filter_by(id=result.id).first().report is not None
+
+    # Test a submission failing to be graded inline.
+    def test_upload_file_failing(self):
+        def fail(result, filename):
+            raise RuntimeError("grader crashed")
+
+        grade_result = grading.grade_result
+        try:
+            grading.grade_result = fail
+            self.upload_file()
+        finally:
+            grading.grade_result = grade_result
+
+        # The result isn't left pending forever.
+        self.assertEqual(Result.query.filter_by(user_id=1).all()[-1].status, Result.FAILED)
+
+    # Test putting back results of graders which went down into the queue.
+    def test_requeue_expired(self):
+        self.upload_file()
+        result = Result.query.filter_by(user_id=1).all()[-1]
+        result.status, result.claimed_at = Result.RUNNING, datetime.utcnow()
+        db.session.commit()
+
+        # Results of a live grader are left running.
+        requeue_expired()
+        self.assertEqual(Result.query.get(result.id).status, Result.RUNNING)
+
+        result.claimed_at = datetime.utcnow() - timedelta(seconds=app.config['GRADING_LEASE'] + 1)
+        db.session.commit()
+
+        requeue_expired()
+        self.assertEqual(Result.query.get(result.id).status, Result.PENDING)
+
+    # Test submitting valid code nested deeper than the recursion limit.
+    def test_upload_deeply_nested(self):
+        self.create_session()
+
+        with open('sample.py', 'r') as file:
+            to_test = file.read() + "\n\ndef f(x):\n    return " + "+".join(["x"] * 1000) + "\n"
+
+        response = self.app.post('/submit/1/1', data = dict(filename=(io.BytesIO(to_test.encode()), 'test.py')), follow_redirects=True)
+        assert "Failed to parse input" in str(response.data)
+
+        # Its tree is stored as unparsable instead of being parsed again every time it is compared.
+        result = Result.query.filter_by(user_id=1).all()[-1]
+        self.assertEqual(result.status, Result.DONE)
+        self.assertEqual(result.ast_version, AST_VERSION)
+        self.assertIsNone(result.ast_tree)
+
+    # Test highlighting code with any line endings.
+    def test_highlight_line_endings(self):
+        for code in ('a = 1\nb = 2\nc = 3', 'a = 1\r\nb = 2\r\nc = 3', 'a = 1\rb = 2\rc = 3'):
+            lines = highlight_lines(code)
+            self.assertEqual(len(lines), 3)
+            assert all(line.endswith('\n') and '\r' not in line for line in lines)
+
 
 if __name__ == '__main__':
     unittest.main()
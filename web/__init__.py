@@ -18,10 +18,18 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config["FILE_UPLOADS"] = "web/tmp"
 app.config["SESSION_UPLOADS"] = "web/tests"
+app.config["CORPUS_DIR"] = os.getenv('CORPUS_DIR', 'web/corpus')  # Fingerprint index of all sessions and archives, shared by web and worker
+app.config['CORPUS_INCREMENTAL'] = os.getenv('CORPUS_INCREMENTAL', '1') == '1'  # Add graded results to it in the background
 app.config["ALLOWED_EXTENSIONS"] = ["py", "ipynb"]
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024
 app.config['CODEMIRROR_LANGUAGES'] = ['python']
 app.config['WTF_CSRF_ENABLED'] = True
+app.config['GRADING_ASYNC'] = os.getenv('GRADING_ASYNC', '0') == '1'  # Grade through the queue drained by grader.py
+app.config['GRADING_LEASE'] = int(os.getenv('GRADING_LEASE', '900'))  # Seconds before a running result is graded again
+app.config['TREE_SIMILARITY_THRESHOLD'] = float(os.getenv('TREE_SIMILARITY_THRESHOLD', '0.5'))  # Tree distances only computed above it
+app.config['COMPARE_TOP_K'] = int(os.getenv('COMPARE_TOP_K', '10'))  # Results compared exactly in compare_index
+app.config['PLAGIARISM_PROCESSES'] = int(os.getenv('PLAGIARISM_PROCESSES', os.cpu_count() or 1))  # Processes computing session reports
+app.config['PLAGIARISM_PRECOMPUTE'] = os.getenv('PLAGIARISM_PRECOMPUTE', '1') == '1'  # Compare graded results in the background
 
 # Initialize the dependencies for Flask app.
 csrf = CSRFProtect()
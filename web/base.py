@@ -7,16 +7,22 @@ from RestrictedPython.Guards import guarded_iter_unpack_sequence, guarded_unpack
 
 from restricted_guard import get_safe_globals
 
+import copy
+import time
 import collections
 import numpy as np
-import multiprocess
-from pathos.pools import ProcessPool
 
+from sandbox import pool, SandboxTimeout
 
-def getResult(code_block, function_name, params, blacklist):
-    """Run the user submitted function against test cases and return the outcome."""
 
-    # Check if the function is provided by the user code.
+def getResults(code_block, cases, blacklist):
+    """Run the user submitted functions against a batch of test cases and yield each outcome.
+
+    The user code is only executed once and every case is run inside that same namespace. Each
+    outcome carries the (wall, cpu) time spent on the case, measured inside the worker. The time
+    spent executing the module itself is counted towards the first case.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
 
     safe_locals = {}
 
@@ -31,20 +37,51 @@ def getResult(code_block, function_name, params, blacklist):
         if item in list(safe_globals.keys()):
             safe_globals.pop(item)
 
-    try:
-        exec(code_block, safe_globals, safe_locals)
-    except Exception as e:
-        return (1, str(e))
-
-    if function_name not in safe_locals:
-        return (1, f"Function {function_name} not found")
+    def elapsed():
+        """Get the time spent since the last call."""
+        nonlocal wall, cpu
+        timing = (time.perf_counter() - wall, time.process_time() - cpu)
+        wall, cpu = time.perf_counter(), time.process_time()
+        return timing
 
     try:
-        result = safe_locals[function_name](*params)
-        return (0, result)
+        exec(code_block, safe_globals, safe_locals)
     except Exception as e:
-        # Return the exception if one is encountered when running the tests.
-        return (1, str(e))
+        for _ in cases:
+            yield (1, str(e), elapsed())
+        return
+
+    for function_name, params in cases:
+
+        # Check if the function is provided by the user code.
+        if function_name not in safe_locals:
+            yield (1, f"Function {function_name} not found", elapsed())
+            continue
+
+        try:
+            # Cases may share their parameters, a function changing them in place mustn't affect the others.
+            result = safe_locals[function_name](*copy.deepcopy(params))
+            yield (0, result, elapsed())
+        except Exception as e:
+            # Return the exception if one is encountered when running the tests.
+            yield (1, str(e), elapsed())
+
+
+def compare_lists(a, b):
+    """Utility method to compare the runtime results and provided answers."""
+
+    if not isinstance(a, (tuple, list, np.ndarray)) and not isinstance(b, (tuple, list, np.ndarray)):
+        # Give a threshold for minimum difference between float point numbers.
+        if isinstance(a, (float, np.float64)) and isinstance(b, (float, np.float64)):
+            return np.isclose(a, b, rtol=1e-05, atol=1e-08, equal_nan=False)
+        return a == b
+    if type(a) != type(b):
+        return False
+    if len(a) == len(b) == 0:
+        return True
+    if len(a) != len(b):
+        return False
+    return all(map(compare_lists, a, b))
 
 
 class TimeoutException(Exception):
@@ -70,77 +107,83 @@ class BaseTest(object):
         self.parameters = {}
         self.answers = {}
 
-    def test(self, runtime, blacklist):
-        """Method for running tests with runtime and blacklisted libraries constraints."""
-        result = {}
+        # Timing data of the last run, see 'test'.
+        self.timing = {}
 
-        # Run each test individually.
-        for entry_point in self.parameters:
-            result[entry_point] = self._test_question(
-                runtime, entry_point, blacklist)
+    @classmethod
+    def from_fixtures(cls, func, parameters, answers):
+        """Build the test from stored parameters and answers without running the subclass initializer."""
+        test = cls.__new__(cls)
+        BaseTest.__init__(test, func)
 
-        return result
+        test.parameters = parameters
+        test.answers = answers
+        return test
 
-    def _test_question(self, runtime, entry_point, blacklist):
-        """Private method for running a specific test case."""
+    def test(self, runtime, blacklist):
+        """Method for running tests with runtime and blacklisted libraries constraints.
+
+        Besides returning the outcome of every case, the run stores its timing data in 'self.timing':
+        {'wall': ..., 'cpu': ..., 'questions': {question: {'wall': ..., 'cpu': ..., 'cases': {case: (wall, cpu)}}}}
+        """
+        self.timing = {'wall': 0.0, 'cpu': 0.0, 'questions': {
+            entry_point: {'wall': 0.0, 'cpu': 0.0, 'cases': {}} for entry_point in self.parameters}}
 
         # Compile user submitted code to a safe version with RestrictedPython.
-        byte_code = compile_restricted_exec(
-            self.func,
-            filename='<inline code>'
-        )
-        errs = {}
+        try:
+            byte_code = compile_restricted_exec(
+                self.func,
+                filename='<inline code>'
+            )
+        except RecursionError:
+            # Its transformer recurses once per level of the AST, valid code can be nested deeper.
+            byte_code = None
 
         # Check if RestrictedPython could successfully parse the code.
-        if not byte_code.code:
-            for ind in range(len(self.parameters[entry_point])):
-                errs[ind] = 'Failed to parse input'
-            return errs
-
-        p = ProcessPool()
+        if not byte_code or not byte_code.code:
+            return {entry_point: {ind: 'Failed to parse input' for ind in range(len(self.parameters[entry_point]))}
+                    for entry_point in self.parameters}
+
+        # Flatten all questions into a single batch of test cases.
+        cases = [(entry_point, params) for entry_point in self.parameters for params in self.parameters[entry_point]]
+        answers = [answer for entry_point in self.parameters for answer in self.answers[entry_point]]
+
+        # Lease one pre-warmed sandbox worker for the whole submission.
+        with pool.lease() as worker:
+            outcomes = self._run_cases(worker, byte_code.code, cases, runtime, blacklist)
+
+        result = {entry_point: {} for entry_point in self.parameters}
+        for (entry_point, params), (status, output, timing), answer in zip(cases, outcomes, answers):
+            if status == 1:  # 1 indicates that there is an error.
+                result[entry_point][str(params)] = output
+            elif compare_lists(output, answer):
+                result[entry_point][str(params)] = "Passed"
+            else:
+                result[entry_point][str(params)] = f"Wrong Answer: {output}"
 
-        # Iterate over each test case.
-        for i, params in enumerate(self.parameters[entry_point]):
+            question = self.timing['questions'][entry_point]
+            question['cases'][str(params)] = timing
+            for i, key in enumerate(('wall', 'cpu')):
+                question[key] += timing[i]
+                self.timing[key] += timing[i]
 
-            # Use multiprocess here to keep track of the runtime and terminate any that goes over the runtime.
-            try:
-                res = p.amap(getResult, [byte_code.code], [entry_point], [params], [blacklist])
-            except ValueError as e:
-                p.restart()
-                res = p.amap(getResult, [byte_code.code], [entry_point], [params], [blacklist])
+        return result
 
-            try:
-                result = res.get(timeout=runtime)[0]
-            except multiprocess.context.TimeoutError as e:
-                result = (1, "Time Out")
-                p.terminate()
-
-            # Properly close the process if it did not terminate clean.
-
-            def compare_lists(a, b):
-                """Utility method to compare the runtime results and provided answers."""
-
-                if not isinstance(a, (tuple, list, np.ndarray)) and not isinstance(b, (tuple, list, np.ndarray)):
-                    # Give a threshold for minimum difference between float point numbers.
-                    if isinstance(a, (float, np.float64)) and isinstance(b, (float, np.float64)):
-                        return np.isclose(a, b, rtol=1e-05, atol=1e-08, equal_nan=False)
-                    return a == b
-                if type(a) != type(b):
-                    return False
-                if len(a) == len(b) == 0:
-                    return True
-                if len(a) != len(b):
-                    return False
-                return all(map(compare_lists, a, b))
-
-            if result[0] == 1:  # 1 indicates that there is an error.
-                errs[str(params)] = result[1]
-            elif compare_lists(result[1], self.answers[entry_point][i]):
-                errs[str(params)] = "Passed"
-            else:
-                errs[str(params)] = f"Wrong Answer: {result[1]}"
+    def _run_cases(self, worker, code, cases, runtime, blacklist):
+        """Private method for running a batch of test cases inside one sandbox worker.
 
-        p.close()
-        p.join()
+        Outcomes are streamed back one case at a time so the runtime limit applies to each case. A
+        worker that goes over the runtime is killed and the remaining cases continue on a fresh one.
+        """
+        outcomes = []
 
-        return errs
+        while len(outcomes) < len(cases):
+            try:
+                for outcome in worker.stream(getResults, (code, cases[len(outcomes):], blacklist), timeout=runtime):
+                    outcomes.append(outcome)
+            except SandboxTimeout:
+                # A timed out case used up its whole time budget.
+                outcomes.append((1, "Time Out", (runtime, runtime)))
+                worker.recycle()
+
+        return outcomes
@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify, make_response
+from flask_login import current_user
 from web.utils import admin_required_api, user_required_api, is_valid, read_file, convert_jupyter, compile_results
 from werkzeug.utils import secure_filename
-from web.models import User, Result, Session, Question, Case
-from web import csrf, db
+from web.models import User, Result, Session
+from web.grading import create_result, grade_or_fail
+from web.report import nearest_results
+from web import app, csrf
 import pybadges
-import timeit
 
 api_template = Blueprint('apis', __name__, template_folder='../templates')
 
@@ -52,37 +54,69 @@ def submit(session_id):
         else:
             to_test = convert_jupyter(file, filename)
 
-        d = {}
-        exec(setting.test_code, d)
+        to_add = create_result(user, setting, to_test)
 
-        temp = d['TestCases'](to_test)
-        res = temp.test(runtime=setting.runtime,
-                        blacklist=setting.get_blacklist())
+        # Leave the grading to the queue, the outcome could be polled at /apis/result/<id>.
+        if app.config['GRADING_ASYNC']:
+            return jsonify(data={'message': 'Submission queued', 'result_id': to_add.id})
 
-        # Record runtime.
-        time = round(timeit.timeit(lambda: d['TestCases'](to_test).test(
-            runtime=setting.runtime, blacklist=setting.get_blacklist()), number=1), 3)
+        res = grade_or_fail(to_add)
+        if res is None:
+            return jsonify(data={'message': 'Failed to grade submission', 'result_id': to_add.id})
 
-        compiled = compile_results(res)
-        passed_num = sum([1 for question in compiled if compiled[question]
-                          ['passed_num'] == compiled[question]['total_num']])
+        return jsonify(data={'message': compile_results(res)})
 
-        to_add = Result(user_id=user.id, email=user.email, session_id=setting.id,
-                        passed_num=passed_num, content=to_test, runtime=time, success=passed_num == len(temp.answers))
-        db.session.add(to_add)
 
-        for question in compiled:
-            q = Question(
-                passed_num=compiled[question]['passed_num'], name=question)
-            for reason in compiled[question]['reason']:
-                r = compiled[question]['reason'][reason]
-                q.cases.append(
-                    Case(case_content=reason, success=r == "Passed", reason=r))
-            to_add.questions.append(q)
+@api_template.route('/result/<result_id>', methods=["GET", "POST"])
+@csrf.exempt
+def result_status(result_id):
+    """Get the grading status of a submission.
+
+    Logged in users can poll with GET. Scripts could POST their credentials as in the other apis.
+    """
+    if current_user.is_authenticated:
+        user = current_user
+    else:
+        credentials = request.json['credentials'] if request.json else request.form
+        user = User.query.filter_by(email=str(credentials.get('email'))).first()
+        if user is None or not user.check_password(str(credentials.get('password'))):
+            return jsonify(data={'message': 'Fails to verify user credentials'})
+
+    result = Result.query.filter_by(id=result_id).first()
+    if not result or (result.user_id != user.id and not user.is_admin):
+        return jsonify(data={'message': 'Result not found'})
+
+    data = {'result_id': result.id, 'status': result.status or Result.DONE}
+    if result.status in (None, Result.DONE):
+        data.update(passed_num=result.passed_num, success=result.success, runtime=result.runtime)
 
-        db.session.commit()
+    return jsonify(data=data)
 
-        return jsonify(data={'message': compiled})
+
+@api_template.route('/nearest/<result_id>', methods=["POST"])
+@admin_required_api
+@csrf.exempt
+def nearest(result_id):
+    """Get the results of other users in the session most similar to a submission.
+
+    The number of results 'k' and the minimum 'threshold' of similarity are optional in the request.
+    """
+    result = Result.query.filter_by(id=result_id).first()
+    if not result:
+        return jsonify(data={'message': 'Result not found'})
+
+    try:
+        k = int(request.json.get('k', app.config['COMPARE_TOP_K']))
+        threshold = float(request.json.get('threshold', app.config['TREE_SIMILARITY_THRESHOLD']))
+    except (TypeError, ValueError):
+        return jsonify(data={'message': 'Invalid k or threshold'})
+
+    if k < 0 or not 0 <= threshold <= 1:
+        return jsonify(data={'message': 'k must be at least 0 and threshold between 0 and 1'})
+
+    neighbours = [{'result_id': neighbour.id, 'email': neighbour.email, 'similarity': similarity}
+                  for similarity, neighbour in nearest_results(result, k, threshold)]
+    return jsonify(data={'result_id': result.id, 'neighbours': neighbours})
 
 
 @api_template.route('/badges')
@@ -1,7 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for
+from web import app, db
 from web.utils import admin_required
+from web.forms import FilterResult
 from web.plagiarism import Plagiarism
 from web.models import Result, Session
+from web.fingerprints import match_result, session_matches
+from web.trees import ensure_parsed, find_copies, EXACT
+from web.sketches import rank_by_sketch
+from web.subtrees import session_shared_subtrees
+from web.report import compare_results, session_report
+from web.corpus import match_corpus
 
 compare_template = Blueprint(
     'compare', __name__, template_folder='../templates')
@@ -20,10 +28,11 @@ def compare(result_id1, result_id2):
     # Get the similarity level and highlighted code block.
 
     parsed1, parsed2 = p.highlight_diff()
-    similarity = p.tree_distance()
+    metrics = compare_results([p.result_1, p.result_2], [(0, 1)])[(p.r1, p.r2)]
+    similarity = metrics['similarity']
 
     # Compile a list of test results using different plagiarism detection algorithms.
-    comparison = p.compile_plagarism_report_two()
+    comparison = [metrics[key] for key in PLAGIARISM_RANKING + ['comment_edit_distance']] if p.parsable else []
 
     return render_template('compare.html', email1=p.result_1.email, email2=p.result_2.email, parsed1=parsed1, parsed2=parsed2, comparison=comparison, similarity=similarity)
 
@@ -31,22 +40,40 @@ def compare(result_id1, result_id2):
 @compare_template.route('/compare/<result_id1>', methods=['GET', 'POST'])
 @admin_required
 def compare_index(result_id1):
-    """Endpoint for showing a list of results in comparison with the current submission."""
+    """Endpoint for showing a list of results in comparison with the current submission.
 
-    r1 = Result.query.filter_by(id=result_id1).first()
+    Only the 'top' most similar results according to their sketches get their exact similarity.
+    """
 
-    # Filter out results that are created by the same user.
-    rs = [r for r in Result.query.filter_by(session_id=r1.session_id).all() if r.user_id != r1.user_id]
+    r1 = Result.query.options(db.undefer('ast_sketch')).filter_by(id=result_id1).first()
+    threshold = app.config['TREE_SIMILARITY_THRESHOLD']
+    top = request.args.get('top', app.config['COMPARE_TOP_K'], type=int)
 
+    # Filter out results that are created by the same user.
+    rs = [r for r in Result.query.options(db.undefer('ast_sketch')).filter_by(session_id=r1.session_id).all()
+          if r.user_id != r1.user_id]
+    ensure_parsed([r1] + rs)
+
+    # Rank the results by their sketches and only compute the tree distance of the top ones.
+    ranked = rank_by_sketch(r1, rs)
+    compared = [r1] + [result for _, result in ranked[:max(top, 0)]]
+    report = compare_results(compared, [(0, i) for i in range(1, len(compared))], threshold)
     results = []
-    similarities = []
 
-    for result in rs:
-        p = Plagiarism(r1, result.id)
-        results.append((p.tree_distance(), result))
+    # Fingerprints shared with each other result, read from the posting lists of the submission only.
+    shared = match_result(r1)
+
+    for rank, (estimate, result) in enumerate(ranked):
+        if rank < top:
+            results.append((report[(r1.id, result.id)]['similarity'], result, False, shared.get(result.id, 0)))
+        else:
+            results.append((round(estimate, 3), result, True, shared.get(result.id, 0)))
+
+    # Submissions of other sessions and archived solutions sharing fingerprints, from the corpus index.
+    corpus = match_corpus(r1, app.config['COMPARE_TOP_K'])
 
-    form = FilterResult()
-    return render_template('compare_index.html', form=form, results=results, r1=r1.id)
+    form = FilterResult(threshold=threshold)
+    return render_template('compare_index.html', form=form, results=results, r1=r1.id, corpus=corpus)
 
 
 @compare_template.route('/plagiarism/<session_id>', methods=['GET', 'POST'])
@@ -54,58 +81,49 @@ def compare_index(result_id1):
 def plagiarism_session(session_id):
     """Endpoint for showing all the plagiarism comparisons in a specific session."""
 
-    def compare_two_users(results_1, results_2):
-        """Utility function for comparing plagiarim results between two users."""
-
-        c = []
-        for r1 in results_1:
-            for r2 in results_2:
-                p = Plagiarism(r1.id, r2.id)
-                report = p.compile_plagarism_report_two()
-
-                temp = {
-                    'similarity': round(p.tree_distance(), 3),
-                    'exact_match': report[0],
-                    'unifying_ast_match': report[1],
-                    'ast_match_ignoring_variables': report[2],
-                    'comment_edit_distance': round(report[3], 3),
-                    'r1': r1.id,
-                    'r2': r2.id,
-                    'email1': r1.user.email,
-                    'email2': r2.user.email
-                }
-
-                # Don't need to include all keys if a result of higher ranking is true.
-                for ind, key in enumerate(PLAGIARISM_RANKING):
-                    if temp[key]:
-                        for later_key in PLAGIARISM_RANKING[ind + 1:]:
-                            temp[later_key] = False
-                        break
-
-                c.append(temp)
-
-        return c
-
     all_submitted_users = list(Session.query.filter_by(id=session_id).first().get_passed_submission_students())
     list_of_results = Result.query.filter_by(session_id=session_id, success=True).all()
     res = {}
 
-    # Query against all submitted users.
-    for u1 in range(len(all_submitted_users)):
-        user_1 = all_submitted_users[u1]
-        result_user_1 = max(filter(lambda x: x.user_id == user_1.id, list_of_results), key=lambda x: x.id)
-        temp = []
-
-        for u2 in range(len(all_submitted_users)):
-            if u1 == u2:
-                continue
-            user_2 = all_submitted_users[u2]
-            result_user_2 = max(filter(lambda x: x.user_id == user_2.id, list_of_results), key=lambda x: x.id)
-
-            temp.extend(compare_two_users([result_user_1], [result_user_2]))
+    # Fingerprint overlap and shared functions / blocks of every pair of latest submissions, read from
+    # the indices in one pass.
+    latest_results = [max(filter(lambda x: x.user_id == user.id, list_of_results), key=lambda x: x.id)
+                      for user in all_submitted_users]
+    overlaps = session_matches(session_id, latest_results)
+    shared_subtrees = session_shared_subtrees(session_id, latest_results)
+
+    # Groups of latest submissions with exactly the same AST.
+    emails = {result.id: result.email for result in latest_results}
+    copies = [[emails[result_id] for result_id in group] for group in find_copies(session_id, EXACT, latest_results)]
+
+    # Every metric is symmetric, so each pair of users is compared once and stored for the next views.
+    report = session_report(latest_results, app.config['TREE_SIMILARITY_THRESHOLD'])
+    comparisons = {result.id: [] for result in latest_results}
+
+    for (id_1, id_2), metrics in report.items():
+        pair = tuple(sorted((id_1, id_2)))
+        metrics = dict(metrics, fingerprint_overlap=round(overlaps.get(pair, 0.0), 3),
+                       shared_subtrees=shared_subtrees.get(pair, 0))
+
+        # Don't need to include all keys if a result of higher ranking is true.
+        for ind, key in enumerate(PLAGIARISM_RANKING):
+            if metrics[key]:
+                for later_key in PLAGIARISM_RANKING[ind + 1:]:
+                    metrics[later_key] = False
+                break
+
+        # Mirror the comparison into the lists of both users.
+        comparisons[id_1].append(dict(metrics, r1=id_1, r2=id_2))
+        comparisons[id_2].append(dict(metrics, r1=id_2, r2=id_1))
+
+    users = {result.id: result.user.email for result in latest_results}
+    for result in latest_results:
+        temp = comparisons[result.id]
+        for c in temp:
+            c['email1'], c['email2'] = users[c['r1']], users[c['r2']]
 
         # Sort reversely based on similarity.
         temp.sort(key=lambda x: x['similarity'], reverse=True)
-        res[result_user_1.email] = temp
+        res[result.email] = temp
 
-    return render_template('plagiarism_session.html', results=res)
+    return render_template('plagiarism_session.html', results=res, copies=copies)
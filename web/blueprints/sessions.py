@@ -4,6 +4,7 @@ from web.models import Course, Session, Access
 from web.forms import UploadForm
 from werkzeug.utils import secure_filename
 from web.utils import read_file, admin_required, check_session_file_parsable
+from web.suites import load_suite, dump_fixtures, invalidate_suite
 from werkzeug.datastructures import MultiDict
 from web import app, db
 
@@ -39,12 +40,15 @@ def upload_session():
         course_id = Course.query.filter_by(
             course_num=form.course_num.data).first().id
         to_add = {'course_id': course_id, 'runtime': form.runtime.data, 'description': form.description.data,
-                  'blacklist': form.blacklist.data, 'session_num': form.session_num.data, 'test_code': test_code}
+                  'blacklist': form.blacklist.data, 'session_num': form.session_num.data, 'test_code': test_code,
+                  'fixtures': dump_fixtures(load_suite(test_code))}
 
         # Update / insert session settings
         if Session.query.filter_by(course_id=course_id, session_num=form.session_num.data).first():
             s = Session.query.filter_by(
                 course_id=course_id, session_num=form.session_num.data).first()
+            if s.test_code != test_code:
+                invalidate_suite(s.test_code)
             for key, val in to_add.items():
                 setattr(s, key, val)
         else:
@@ -107,7 +111,16 @@ def change_session(session_id):
         if form.filename.data:
             filename = secure_filename(form.filename.data.filename)
             test_code = read_file(form.filename.data, filename)
+
+            passed, err = check_session_file_parsable(test_code)
+            if not passed:
+                flash(err)
+                return render_template('upload_session.html', form=form)
+
+            if session.test_code != test_code:
+                invalidate_suite(session.test_code)
             session.test_code = test_code
+            session.fixtures = dump_fixtures(load_suite(test_code))
 
         session.session_num = form.session_num.data
         session.description = form.description.data
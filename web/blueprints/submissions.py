@@ -1,13 +1,13 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import current_user, login_required
 from flask_breadcrumbs import default_breadcrumb_root, register_breadcrumb
-from web.models import Session, Result, Question, Case, Codecacher, Course, Plagiarism
+from web.models import Session, Codecacher, Course
 from werkzeug.utils import secure_filename
 from web.forms import CodeSumitForm
-from web.utils import is_valid, read_file, convert_jupyter, highlight_python_with_flake8, compile_results, flake8_test, flake8_parser
+from web.utils import is_valid, read_file, convert_jupyter
+from web.grading import create_result, grade_or_fail
 from web import app, db, csrf
-from time import gmtime, strftime
-import timeit
+import json
 
 submission_template = Blueprint(
     'submission', __name__, template_folder='../templates')
@@ -73,11 +73,8 @@ def submission(course_id, session_id):
     if cache:
         pre_filled = cache.text
     else:
-        d = {}
-        exec(setting.test_code, d)
-
         pre_filled = ""
-        dummy = d['TestCases']('DUMMY')
+        dummy = setting.get_test_cases()
 
         for function_name in dummy.parameters:
             pre_filled += f"def {function_name}(*args):\n\tpass\n\n\n"
@@ -97,65 +94,21 @@ def submission(course_id, session_id):
                     to_test = read_file(form.filename.data, filename)
                 else:
                     to_test = convert_jupyter(form.filename.data, filename)  # Convert jupyter notebook to python
-
-                style_check = flake8_test(to_test, filename)
             else:
+                filename = "user_submission.py"
                 to_test = form.text.data
-                style_check = flake8_test(to_test, "user_submission.py")
-
-            d = {}
-            exec(setting.test_code, d)  # Compile the test code
-
-            # Read the user submitted code
-            temp = d['TestCases'](to_test)
-
-            res = temp.test(runtime=setting.runtime,
-                            blacklist=setting.get_blacklist())
-
-            # Record runtime
-            time = round(timeit.timeit(lambda: d['TestCases'](to_test).test(
-                runtime=setting.runtime, blacklist=setting.get_blacklist()), number=1), 3)
-
-            # Convert the test result to correct formatting
-            compiled = compile_results(res)
-            passed_num = sum([1 for question in compiled if compiled[question]
-                              ['passed_num'] == compiled[question]['total_num']])
-
-            ts = strftime("%Y-%m-%d %H:%M:%S", gmtime())
-            to_add = Result(
-                user_id=current_user.id,
-                email=current_user.email,
-                session_id=setting.id,
-                passed_num=passed_num,
-                content=to_test,
-                runtime=time,
-                success=passed_num == len(temp.answers),
-                ts=ts,
-                style_check=style_check
-            )
-
-            db.session.add(to_add)
-
-            for question in compiled:
-                q = Question(
-                    passed_num=compiled[question]['passed_num'], name=question)
-                for reason in compiled[question]['reason']:
-                    r = compiled[question]['reason'][reason]
-                    q.cases.append(
-                        Case(case_content=reason, success=r == "Passed", reason=r))
-                to_add.questions.append(q)
-
-            db.session.commit()
-
-            return render_template(
-                'results.html', 
-                result=res,
-                passed=passed_num,
-                total=len(temp.answers),
-                file=highlight_python_with_flake8(to_test, flake8_parser(style_check)),
-                time=time,
-                i=id
-            )
+
+            to_add = create_result(current_user, setting, to_test)
+
+            # Leave the grading to the queue and let the result page poll for completion.
+            if app.config['GRADING_ASYNC']:
+                return redirect(url_for('summary.summary_case', result_id=to_add.id))
+
+            # A submission failing to be graded is shown as failed instead of pending forever.
+            if grade_or_fail(to_add, filename) is None:
+                return redirect(url_for('summary.summary_case', result_id=to_add.id))
+
+            return render_template('results.html', **json.loads(to_add.report), i=to_add.id)
 
         return redirect(request.url)
 
@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request
 from web.models import Course, Session, Result
-from web.utils import admin_required, highlight_python, highlight_python_with_flake8, flake8_parser
+from web.utils import admin_required
+from web.grading import build_report
+from web import db
 from flask_breadcrumbs import default_breadcrumb_root, register_breadcrumb
 from flask_login import login_required
+import json
 
 summary_template = Blueprint(
     'summary', __name__, template_folder='../templates')
@@ -83,21 +86,17 @@ def summary_result(course_id, session_id, user_id):
 @login_required
 def summary_case(result_id):
     """Individual submission details."""
-    result = Result.query.filter_by(id=result_id).first()
-
-    # Re-populate the result with saved records.
-    res = {question.name: {case.case_content: case.reason for case in question.cases}
-           for question in result.questions}
-
-    # p = sorted(result.plagiarisms, key=lambda x: (-x.exact_match, -x.unifying_ast, -x.ignore_variables, -x.reordering_ast, x.edit_tree))[:3]
-
-    style = result.style_check if result.style_check else "Style Check not initialized for this commit."
-    return render_template(
-        'results.html',
-        result=res,
-        passed=result.passed_num,
-        total=len(result.questions),
-        file=highlight_python_with_flake8(result.content, flake8_parser(style)),
-        time=result.runtime,
-        i=result.id
-    )
+    result = Result.query.options(db.undefer('report')).filter_by(id=result_id).first()
+
+    # The page polls until the grading queue gets to the submission.
+    if not result.is_graded():
+        return render_template('results.html', pending=True, i=result.id)
+
+    # Results graded before reports were stored get theirs built once from the saved records.
+    if not result.report:
+        res = {question.name: {case.case_content: case.reason for case in question.cases}
+               for question in result.questions}
+        result.report = json.dumps(build_report(result, res))
+        db.session.commit()
+
+    return render_template('results.html', **json.loads(result.report), i=result.id, status=result.status)
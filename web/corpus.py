@@ -0,0 +1,294 @@
+"""Corpus-wide index of winnowing fingerprints, spanning all sessions, courses and imported archives.
+
+The index is a directory of immutable segments. A segment holds the fingerprints of a batch of
+documents (results or archived solutions) as two arrays sorted by fingerprint, memory-mapped when
+read: the 32 bit fingerprint hashes and the number of the document each one comes from. The
+result id, session id and number of fingerprints of its documents are memory-mapped arrays too,
+only the paths of archived solutions are kept in its JSON description.
+
+Looking up a submission is a binary search of its fingerprints in each segment, so the history is
+never scanned. Graded results are added one at a time in the background and segments are merged
+into larger ones as they pile up.
+"""
+
+import os
+import glob
+import json
+import fcntl
+import logging
+import threading
+import contextlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from web import app, db
+from web.models import Result
+from web.tokens import get_tokens
+from web.winnowing import fingerprint_tokens, fingerprint_text, WINNOWING_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Segments are merged once there are more of them.
+MAX_SEGMENTS = 8
+
+# Fingerprints found in more documents are boilerplate shared by all the solutions of an exercise.
+MAX_POSTING_LENGTH = 100
+
+# Results fingerprinted and written to the same segment at once by 'update_corpus'.
+BATCH_SIZE = 1000
+
+# Arrays of a segment, memory-mapped from '<segment>.<name>.npy'.
+ARRAYS = ('hashes', 'documents', 'results', 'sessions', 'sizes')
+
+# Id of the documents which aren't results, or don't belong to a session.
+NO_ID = -1
+
+# Segments already loaded by this process, by path. Segments never change once written.
+_segments = {}
+_segments_lock = threading.Lock()
+
+# Thread adding newly graded results to the corpus.
+_background_executor = ThreadPoolExecutor(max_workers=1)
+
+
+class Segment:
+    """Batch of documents of the corpus with their fingerprints, read from its files."""
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path + '.json', 'r') as file:
+            meta = json.load(file)
+
+        self.version = meta['version']
+        self.files = meta['files']
+
+        for name in ARRAYS:
+            setattr(self, name, np.load(f'{path}.{name}.npy', mmap_mode='r'))
+
+    def count_shared(self, hashes):
+        """Count the fingerprints of a sorted array of unique hashes each document contains."""
+        start = np.searchsorted(self.hashes, hashes, side='left')
+        end = np.searchsorted(self.hashes, hashes, side='right')
+
+        lengths = end - start
+        lengths[lengths > MAX_POSTING_LENGTH] = 0
+
+        # Positions of all the matched postings, without a loop over them.
+        offsets = np.repeat(start - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.bincount(self.documents[offsets], minlength=len(self.sizes))
+
+    def fingerprints(self):
+        """Get the sorted fingerprints of each document."""
+        # A stable sort by document keeps the fingerprints of each document sorted.
+        order = np.argsort(self.documents, kind='stable')
+        return np.split(np.asarray(self.hashes)[order], np.cumsum(self.sizes)[:-1])
+
+    def describe(self, i):
+        """Describe a document of the segment, as given to 'write_segment'."""
+        if self.results[i] != NO_ID:
+            return {'result_id': int(self.results[i]), 'session_id': int(self.sessions[i])}
+        return dict(self.files[str(i)])
+
+    def remove(self):
+        """Delete the files of the segment, its description first so it is never read half deleted."""
+        os.remove(self.path + '.json')
+        for name in ARRAYS:
+            os.remove(f'{self.path}.{name}.npy')
+
+
+def unique_fingerprints(tokens):
+    """Get the sorted unique fingerprint hashes of tokenized code, see tokens.tokenize_code."""
+    return np.unique(np.array([h for h, _ in fingerprint_tokens(tokens)], dtype=np.uint32))
+
+
+@contextlib.contextmanager
+def locked(shared=False):
+    """Hold the lock of the corpus, exclusive for writing to it from any process, shared for reading it."""
+    os.makedirs(app.config['CORPUS_DIR'], exist_ok=True)
+
+    with open(os.path.join(app.config['CORPUS_DIR'], 'lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _load_segments():
+    """Load the segments of the corpus computed by the current winnowing version, oldest first.
+
+    The lock of the corpus must be held, so no merge is half done.
+    """
+    paths = sorted(path[:-len('.json')] for path in glob.glob(os.path.join(app.config['CORPUS_DIR'], '*.json')))
+
+    with _segments_lock:
+        for path in set(_segments) - set(paths):
+            del _segments[path]
+
+        for path in paths:
+            if path not in _segments:
+                _segments[path] = Segment(path)
+
+        return [_segments[path] for path in paths if _segments[path].version == WINNOWING_VERSION]
+
+
+def load_segments():
+    """Load the segments of the corpus computed by the current winnowing version, oldest first."""
+    with locked(shared=True):
+        return _load_segments()
+
+
+def write_segment(documents, fingerprints):
+    """Write a new segment from documents and the arrays of their unique fingerprints.
+
+    Documents are {'result_id': ..., 'session_id': ...} for results and {'path': ..., 'archive': ...}
+    for archived solutions. The lock of the corpus must be held.
+    """
+    directory = app.config['CORPUS_DIR']
+    numbers = [int(os.path.basename(path).split('.')[0]) for path in glob.glob(os.path.join(directory, '*.json'))]
+    path = os.path.join(directory, '%08d' % (max(numbers, default=0) + 1))
+
+    hashes = np.concatenate(fingerprints + [np.array([], dtype=np.uint32)])
+    owners = np.repeat(np.arange(len(documents), dtype=np.uint32), [len(f) for f in fingerprints])
+    order = np.lexsort((owners, hashes))
+
+    arrays = {
+        'hashes': hashes[order],
+        'documents': owners[order],
+        'results': np.array([d.get('result_id', NO_ID) for d in documents], dtype=np.int64),
+        'sessions': np.array([d.get('session_id', NO_ID) for d in documents], dtype=np.int64),
+        'sizes': np.array([len(f) for f in fingerprints], dtype=np.int64)
+    }
+    for name, array in arrays.items():
+        np.save(f'{path}.{name}.npy', array)
+
+    # The description is written last, segments are only read once it is complete.
+    files = {str(i): d for i, d in enumerate(documents) if 'result_id' not in d}
+    with open(path + '.json.tmp', 'w') as file:
+        json.dump({'version': WINNOWING_VERSION, 'files': files}, file)
+    os.replace(path + '.json.tmp', path + '.json')
+
+
+def merge_segments():
+    """Merge the newest segments once there are more than MAX_SEGMENTS.
+
+    Newer segments are merged up to an older one larger than all of them together, so every
+    document is only rewritten a logarithmic number of times. The lock of the corpus must be held.
+    """
+    segments = _load_segments()
+    if len(segments) <= MAX_SEGMENTS:
+        return
+
+    merged = [segments.pop(), segments.pop()]
+    while segments and len(segments[-1].sizes) <= sum(len(segment.sizes) for segment in merged):
+        merged.append(segments.pop())
+
+    documents, fingerprints = [], []
+    for segment in reversed(merged):
+        documents.extend(segment.describe(i) for i in range(len(segment.sizes)))
+        fingerprints.extend(segment.fingerprints())
+
+    write_segment(documents, fingerprints)
+    for segment in merged:
+        segment.remove()
+
+
+def indexed_results(segments=None):
+    """Get the ids of the results in segments of the corpus, all of them by default."""
+    segments = load_segments() if segments is None else segments
+    return np.concatenate([segment.results for segment in segments] + [np.array([], dtype=np.int64)])
+
+
+def add_results(results):
+    """Add results to the corpus, leaving out the ones already in it. Returns the number added."""
+    with locked():
+        indexed = set(indexed_results(_load_segments()).tolist())
+        results = [result for result in results if result.id not in indexed]
+
+        if results:
+            write_segment([{'result_id': result.id, 'session_id': result.session_id} for result in results],
+                          [unique_fingerprints(get_tokens(result)['tokens']) for result in results])
+            merge_segments()
+
+    return len(results)
+
+
+def update_corpus():
+    """Add all the results missing from the corpus, from every session. Returns their number."""
+    missing = np.setdiff1d([result_id for result_id, in db.session.query(Result.id)], indexed_results())
+    added = 0
+
+    for i in range(0, len(missing), BATCH_SIZE):
+        batch = missing[i:i + BATCH_SIZE].tolist()
+        added += add_results(Result.query.filter(Result.id.in_(batch)).order_by(Result.id).all())
+
+    return added
+
+
+def _add_scheduled(result_id):
+    """Add a newly graded result to the corpus, in the background thread."""
+    with app.app_context():
+        try:
+            result = Result.query.get(result_id)
+            if result is not None:
+                add_results([result])
+        except Exception:
+            logger.exception(f"Failed to add result {result_id} to the corpus")
+            db.session.rollback()
+
+
+def schedule_result(result):
+    """Add a newly graded result to the corpus in the background."""
+    if app.config['CORPUS_INCREMENTAL']:
+        _background_executor.submit(_add_scheduled, result.id)
+
+
+def import_archive(directory):
+    """Add the python files of a directory of historic solutions to the corpus. Returns their number."""
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.py'), recursive=True))
+    fingerprints = []
+
+    for path in paths:
+        with open(path, 'r', errors='replace') as file:
+            fingerprints.append(np.unique(np.array([h for h, _ in fingerprint_text(file.read())], dtype=np.uint32)))
+
+    if paths:
+        with locked():
+            write_segment([{'path': os.path.relpath(path, directory), 'archive': os.path.abspath(directory)}
+                           for path in paths], fingerprints)
+            merge_segments()
+
+    return len(paths)
+
+
+def match_corpus(result, k=10):
+    """Find the documents of the corpus from other sessions sharing the most fingerprints with a result.
+
+    The results of its own session are left out, they are matched by the session-wide index.
+    Returns up to 'k' (overlap, document) in decreasing order of overlap, where overlap is the fraction
+    of the smaller set of fingerprints found in the other document. Results get their 'email' added.
+    """
+    hashes = unique_fingerprints(get_tokens(result)['tokens'])
+    if not len(hashes):
+        return []
+
+    matches = []
+    for segment in load_segments():
+        shared = segment.count_shared(hashes)
+        shared[np.asarray(segment.sessions) == result.session_id] = 0
+
+        for i in np.flatnonzero(shared):
+            overlap = float(shared[i]) / min(len(hashes), int(segment.sizes[i]))
+            matches.append((round(overlap, 3), segment, i))
+
+    matches = sorted(matches, key=lambda x: x[0], reverse=True)[:k]
+    documents = [segment.describe(i) for _, segment, i in matches]
+
+    emails = dict(db.session.query(Result.id, Result.email).filter(
+        Result.id.in_([d['result_id'] for d in documents if 'result_id' in d])).all())
+    for document in documents:
+        if 'result_id' in document:
+            document['email'] = emails.get(document['result_id'])
+
+    return [(overlap, document) for (overlap, _, _), document in zip(matches, documents)]
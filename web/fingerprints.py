@@ -0,0 +1,93 @@
+"""Session-wide inverted index of winnowing fingerprints (fingerprint hash -> results)."""
+
+import itertools
+import collections
+
+from web import db
+from web.models import Fingerprint
+from web.tokens import get_tokens
+from web.winnowing import fingerprint_tokens, WINNOWING_VERSION
+
+# Fingerprints shared by more than this fraction of the results are boilerplate (e.g. the function
+# signatures every student starts from) and are left out of session-wide matching.
+MAX_DOCUMENT_FREQUENCY = 0.5
+
+# Below this number of results a fingerprint shared by a few of them is as likely to be copied as to be
+# boilerplate, so none is left out.
+MIN_FREQUENCY_RESULTS = 10
+
+
+def index_result(result):
+    """Store the fingerprints of a result in the index, replacing outdated ones."""
+    Fingerprint.query.filter_by(result_id=result.id).delete(synchronize_session=False)
+
+    db.session.bulk_insert_mappings(Fingerprint, [
+        {'hash': h, 'position': position, 'result_id': result.id, 'session_id': result.session_id}
+        for h, position in fingerprint_tokens(get_tokens(result)['tokens'])
+    ])
+    result.fingerprint_version = WINNOWING_VERSION
+
+
+def ensure_indexed(results):
+    """Index the results missing from the index or indexed by an older winnowing version."""
+    outdated = [result for result in results if result.fingerprint_version != WINNOWING_VERSION]
+
+    for result in outdated:
+        index_result(result)
+
+    if outdated:
+        db.session.commit()
+
+
+def match_result(result):
+    """Count the fingerprints each other result in the session shares with a result.
+
+    Only the posting lists of the result's own fingerprints are read, so a new submission is never
+    compared against every prior result. Returns {result id: number of shared fingerprints}.
+    """
+    ensure_indexed([result])
+
+    own = db.aliased(Fingerprint)
+    own_hashes = db.session.query(own.hash).filter(own.result_id == result.id)
+
+    rows = db.session.query(Fingerprint.result_id, db.func.count(db.distinct(Fingerprint.hash))) \
+        .filter(Fingerprint.session_id == result.session_id,
+                Fingerprint.result_id != result.id,
+                Fingerprint.hash.in_(own_hashes)) \
+        .group_by(Fingerprint.result_id).all()
+
+    return dict(rows)
+
+
+def max_document_frequency(count):
+    """Get the number of results out of 'count' above which a shared fingerprint or subtree is boilerplate."""
+    return int(MAX_DOCUMENT_FREQUENCY * count) if count >= MIN_FREQUENCY_RESULTS else count
+
+
+def session_matches(session_id, results):
+    """Find every pair of results sharing fingerprints in a single pass over the posting lists.
+
+    Returns {(result id 1, result id 2): overlap} with result id 1 < result id 2, where overlap is the
+    fraction of the smaller set of fingerprints found in the other result.
+    """
+    ensure_indexed(results)
+    result_ids = [result.id for result in results]
+
+    rows = db.session.query(Fingerprint.hash, Fingerprint.result_id) \
+        .filter(Fingerprint.session_id == session_id, Fingerprint.result_id.in_(result_ids)) \
+        .distinct().order_by(Fingerprint.hash).all()
+
+    counts = collections.Counter(result_id for _, result_id in rows)
+    max_frequency = max_document_frequency(len(result_ids))
+    shared = collections.Counter()
+
+    for _, posting in itertools.groupby(rows, key=lambda row: row[0]):
+        posting = sorted(result_id for _, result_id in posting)
+
+        if len(posting) > max_frequency:
+            continue
+
+        for pair in itertools.combinations(posting, 2):
+            shared[pair] += 1
+
+    return {(r1, r2): n / min(counts[r1], counts[r2]) for (r1, r2), n in shared.items()}
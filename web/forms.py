@@ -77,3 +77,8 @@ class Register(FlaskForm):
     registration_link = StringField("Registration Link for Students ('/register/-link-')", validators=[
         Regexp(regex=r'^[a-z|A-Z|_|\d+|-]+$', message="Invitation link must have no / in between")])
     submit = SubmitField('Submit')
+
+
+class FilterResult(FlaskForm):
+    """Form for filtering compared results by similarity."""
+    threshold = DecimalRangeField('Similarity Threshold', places=2)
@@ -0,0 +1,195 @@
+"""Grading of submitted results, either inline or through the queue drained by grader.py."""
+
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from time import gmtime, strftime
+
+from web import app, db
+from web.models import Result, Question, Case
+from web.tokens import store_tokens
+from web.trees import store_ast
+from web.fingerprints import index_result
+from web.report import schedule_comparisons
+from web.corpus import schedule_result
+from web.utils import compile_results, flake8_test, flake8_parser, highlight_python_with_flake8
+
+logger = logging.getLogger(__name__)
+
+# Threads running the style check of submissions alongside their tests.
+_style_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def create_result(user, setting, to_test):
+    """Store a new submission as a pending result waiting to be graded."""
+    to_add = Result(
+        user_id=user.id,
+        email=user.email,
+        session_id=setting.id,
+        content=to_test,
+        ts=strftime("%Y-%m-%d %H:%M:%S", gmtime()),
+        status=Result.PENDING
+    )
+
+    db.session.add(to_add)
+    db.session.commit()
+    return to_add
+
+
+def run_style_check(to_test, filename):
+    """Run the style check in its own application context, as it is called from other threads."""
+    with app.app_context():
+        return flake8_test(to_test, filename)
+
+
+def grade_result(result, filename="user_submission.py"):
+    """Run the test cases of the session against a result and record the outcome.
+
+    The style check runs concurrently with the tests and both are joined before saving the result.
+    Returns the raw test result in format: {question1: {case: reason, ...}, question2: {...}}
+    """
+    setting = result.session
+    style_check = _style_executor.submit(run_style_check, result.content, filename)
+
+    # Read the user submitted code
+    temp = setting.get_test_cases(result.content)
+    res = temp.test(runtime=setting.runtime, blacklist=setting.get_blacklist())
+
+    try:
+        result.style_check = style_check.result()
+    except Exception as e:
+        result.style_check = f"Failed to load flake8 module {e}"
+
+    # Convert the test result to correct formatting
+    compiled = compile_results(res)
+    passed_num = sum([1 for question in compiled if compiled[question]
+                      ['passed_num'] == compiled[question]['total_num']])
+
+    result.passed_num = passed_num
+    result.runtime = round(temp.timing['wall'], 3)
+    result.success = passed_num == len(temp.answers)
+
+    for question in compiled:
+        q = Question(
+            passed_num=compiled[question]['passed_num'], name=question)
+        for reason in compiled[question]['reason']:
+            r = compiled[question]['reason'][reason]
+            q.cases.append(
+                Case(case_content=reason, success=r == "Passed", reason=r))
+        result.questions.append(q)
+
+    result.status = Result.DONE
+    result.report = json.dumps(build_report(result, res))
+    db.session.commit()
+
+    try:
+        store_tokens(result)
+        store_ast(result)
+        index_result(result)
+        db.session.commit()
+    except Exception:
+        # The result is graded whatever happens to its indexes, they are built again when it is compared.
+        logger.exception(f"Failed to index result {result.id}")
+        db.session.rollback()
+
+    schedule_comparisons(result)
+    schedule_result(result)
+
+    return res
+
+
+def build_report(result, res):
+    """Build everything the result page shows, so viewing a result is a single row lookup."""
+    style = result.style_check if result.style_check else "Style Check not initialized for this commit."
+
+    return {
+        'result': res,
+        'passed': result.passed_num,
+        'total': len(res),
+        'file': highlight_python_with_flake8(result.content, flake8_parser(style)),
+        'time': result.runtime
+    }
+
+
+def grade_or_fail(result, filename="user_submission.py"):
+    """Grade a result, marking it as failed instead of leaving it running if the grading raises.
+
+    Returns the raw test result, or None if the grading failed.
+    """
+    try:
+        return grade_result(result, filename)
+    except Exception:
+        logger.exception(f"Failed to grade result {result.id}")
+        db.session.rollback()
+        result.status = Result.FAILED
+        db.session.commit()
+
+
+def requeue_expired():
+    """Put back into the queue the results running for longer than the lease of a grader.
+
+    Their grader most likely went down. Graders still alive keep their results until the lease
+    expires, so starting another grader never grades a result twice.
+    """
+    expired = datetime.utcnow() - timedelta(seconds=app.config['GRADING_LEASE'])
+
+    Result.query.filter(Result.status == Result.RUNNING,
+                        db.or_(Result.claimed_at.is_(None), Result.claimed_at < expired)) \
+        .update({'status': Result.PENDING}, synchronize_session=False)
+    db.session.commit()
+
+
+def claim_result():
+    """Atomically take the oldest pending result off the queue and mark it as running."""
+    while True:
+        result = Result.query.filter_by(status=Result.PENDING).order_by(Result.id).first()
+        if not result:
+            return None
+
+        # Another grader may have claimed the same result in between.
+        claimed = Result.query.filter_by(id=result.id, status=Result.PENDING).update(
+            {'status': Result.RUNNING, 'claimed_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+        if claimed:
+            db.session.refresh(result)
+            return result
+
+
+def grade_next():
+    """Grade the next pending result. Returns False if the queue is empty."""
+    with app.app_context():
+        requeue_expired()
+        result = claim_result()
+        if not result:
+            return False
+
+        grade_or_fail(result)
+        return True
+
+
+def run_worker(threads=None, poll_interval=1.0):
+    """Drain the grading queue forever.
+
+    Each thread grades one result at a time on a worker leased from the sandbox pool, so the number
+    of threads defaults to the size of that pool.
+    Results left running by a grader that went down are graded again once their lease expires, see
+    requeue_expired.
+    """
+    from sandbox import pool
+
+    def drain():
+        while True:
+            try:
+                if grade_next():
+                    continue
+            except Exception:
+                logger.exception("Failed to poll the grading queue")
+            time.sleep(poll_interval)
+
+    threads = threads or pool.size
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(threads):
+            executor.submit(drain)
@@ -0,0 +1,46 @@
+"""Syntax highlighting of Python code to html with per line annotations."""
+
+import pygments
+from pygments.lexers import PythonLexer
+from pygments.formatters import HtmlFormatter
+
+PREFIX = '<div class="codehilite"><pre>'
+SUFFIX = '</pre></div>\n'
+
+# Keep leading and trailing blank lines so line numbers stay the same as in the source.
+LEXER = PythonLexer(stripnl=False)
+FORMATTER = HtmlFormatter(style="emacs", cssclass="codehilite", nowrap=True)
+STYLE_DEFS = FORMATTER.get_style_defs()
+
+
+def highlight_lines(code):
+    """Highlight the whole code at once and split the html by line.
+
+    Pygments closes and reopens the tags of tokens spanning several lines (e.g. docstrings) at each
+    line break, so every line is valid html on its own and could be wrapped separately.
+    """
+
+    # Pygments automatically removes tabs so convert them to spaces here
+    code = code.replace('\t', '    ')
+
+    # Pygments turns every line ending into '\n', do it first so lines are counted the same way.
+    code = code.replace('\r\n', '\n').replace('\r', '\n')
+    num_lines = len(code.split('\n'))
+
+    highlighted = pygments.highlight(code, LEXER, FORMATTER).split('\n')[:num_lines]
+    return [line + '\n' for line in highlighted]
+
+
+def render(code, marks=(), extra_css=''):
+    """Render highlighted code with some lines wrapped in extra html.
+
+    'marks' is a tuple of (line number, opening html, closing html) and 'extra_css' gets appended to
+    the pygments style.
+    """
+    lines = highlight_lines(code)
+
+    for lineno, opening, closing in marks:
+        if 0 < lineno <= len(lines):
+            lines[lineno - 1] = opening + lines[lineno - 1] + closing
+
+    return "<style>" + STYLE_DEFS + extra_css + "</style>" + PREFIX + ''.join(lines) + SUFFIX
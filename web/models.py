@@ -1,6 +1,7 @@
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin
 from web import app, db, login
+from web.suites import get_test_cases
 from datetime import datetime
 
 
@@ -25,6 +26,13 @@ class User(UserMixin, db.Model):
 
 class Result(db.Model):
     """Data model for submission results."""
+
+    # Grading status of a submission.
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String)
     passed_num = db.Column(db.Integer)
@@ -38,6 +46,20 @@ class Result(db.Model):
     questions = db.relationship('Question', cascade="all,delete",
                                 backref='result', lazy=True)
     ts = db.Column(db.String)
+    status = db.Column(db.String, default=DONE, index=True)
+    claimed_at = db.Column(db.DateTime)  # When a grader started running the result, see grading.claim_result.
+    report = db.deferred(db.Column(db.String))  # Rendered result page in json, see grading.build_report.
+    fingerprint_version = db.Column(db.Integer)  # Winnowing version of the indexed fingerprints.
+    tokens = db.deferred(db.Column(db.String))  # Token streams in json, see tokens.tokenize_code.
+    ast_version = db.Column(db.Integer)  # Version of the stored AST and hashes, see trees.store_ast.
+    ast_tree = db.deferred(db.Column(db.String))  # Labelled AST in json, see trees.label_tree.
+    ast_sketch = db.deferred(db.Column(db.LargeBinary))  # MinHash sketch of the AST, see sketches.sketch_tree.
+    ast_exact_hash = db.Column(db.String(64), index=True)
+    ast_unifying_hash = db.Column(db.String(64), index=True)
+    ast_ignoring_hash = db.Column(db.String(64), index=True)
+    fingerprints = db.relationship('Fingerprint', cascade="all,delete", backref='result', lazy=True)
+    subtrees = db.relationship('Subtree', cascade="all,delete", backref='result', lazy=True)
+    sketch_bands = db.relationship('SketchBand', cascade="all,delete", backref='result', lazy=True)
     plagiarisms = db.relationship('Plagiarism',
                                   primaryjoin="or_(Result.id == Plagiarism.first_result_id, Result.id == Plagiarism.second_result_id)",
                                   cascade="all,delete", backref='result', lazy=True)
@@ -48,6 +70,10 @@ class Result(db.Model):
         delta = current_time - datetime.strptime(self.ts, "%Y-%m-%d %H:%M:%S")
         return delta
 
+    def is_graded(self):
+        """Check if the grading of the submission has finished."""
+        return self.status in (None, Result.DONE, Result.FAILED)
+
 
 class Question(db.Model):
     """Data model for tests."""
@@ -92,11 +118,16 @@ class Session(db.Model):
     results = db.relationship(
         'Result', cascade="all,delete", backref='session', lazy=True)
     test_code = db.Column(db.String)
+    fixtures = db.deferred(db.Column(db.LargeBinary))  # Parameters and answers evaluated at upload time.
 
     def get_blacklist(self):
         """Get a list of blacklisted packages."""
         return list(filter(lambda x: x != '', self.blacklist.split(',')))
 
+    def get_test_cases(self, func='DUMMY'):
+        """Get the TestCases instance of the session for testing 'func', compiled once per test code."""
+        return get_test_cases(self.test_code, func, lambda: self.fixtures)
+
     def get_submission_students(self):
         """Get a list of students who have submitted.
 
@@ -145,8 +176,59 @@ class Codecacher(db.Model):
                               backref='codecacher', lazy=True, single_parent=True)
 
 
+class StyleCache(db.Model):
+    """Data model for caching style check reports by the hash of the checked code."""
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, index=True)
+    report = db.Column(db.String)
+
+
+class Fingerprint(db.Model):
+    """Data model for the session-wide inverted index of winnowing fingerprints."""
+    id = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.BigInteger, nullable=False)
+    position = db.Column(db.Integer)
+    result_id = db.Column(db.Integer, db.ForeignKey(
+        'result.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey(
+        'session.id'), nullable=False)
+
+    __table_args__ = (db.Index('ix_fingerprint_session_id_hash', 'session_id', 'hash'),)
+
+
+class Subtree(db.Model):
+    """Data model for the session-wide index of hashes of functions, classes and statement blocks."""
+    id = db.Column(db.Integer, primary_key=True)
+    exact_hash = db.Column(db.BigInteger, nullable=False)
+    normalized_hash = db.Column(db.BigInteger, nullable=False)  # Hash with the identifiers left out.
+    label = db.Column(db.String)
+    lineno = db.Column(db.Integer)
+    end_lineno = db.Column(db.Integer)
+    size = db.Column(db.Integer)
+    result_id = db.Column(db.Integer, db.ForeignKey(
+        'result.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey(
+        'session.id'), nullable=False)
+
+    __table_args__ = (db.Index('ix_subtree_session_id_exact_hash', 'session_id', 'exact_hash'),
+                      db.Index('ix_subtree_session_id_normalized_hash', 'session_id', 'normalized_hash'))
+
+
+class SketchBand(db.Model):
+    """Data model for the locality-sensitive hashing index of the bands of AST sketches."""
+    id = db.Column(db.Integer, primary_key=True)
+    band = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)  # Hash of the minimums of the sketch in the band.
+    result_id = db.Column(db.Integer, db.ForeignKey(
+        'result.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey(
+        'session.id'), nullable=False)
+
+    __table_args__ = (db.Index('ix_sketch_band_session_id_band_bucket', 'session_id', 'band', 'bucket'),)
+
+
 class Plagiarism(db.Model):
-    """Data model for plagiarism check results."""
+    """Data model for plagiarism check results, stored once per pair with first_result_id <= second_result_id."""
     __tablename__ = 'plagiarism'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -154,12 +236,18 @@ class Plagiarism(db.Model):
     unifying_ast = db.Column(db.Boolean)
     ignore_variables = db.Column(db.Boolean)
     similarity = db.Column(db.Float)
+    comment_similarity = db.Column(db.Float)
+    threshold = db.Column(db.Float)  # Similarities below it are upper bounds, see report.compare_pair.
+    version = db.Column(db.Integer)
 
     first_result_id = db.Column(db.Integer, db.ForeignKey(
         'result.id'), nullable=False)
     second_result_id = db.Column(db.Integer, db.ForeignKey(
         'result.id'), nullable=False)
 
+    __table_args__ = (db.Index('ix_plagiarism_first_result_id_second_result_id',
+                               'first_result_id', 'second_result_id', unique=True),)
+
 
 @login.user_loader
 def load_user(id):
@@ -1,13 +1,11 @@
-import ast
 import collections
-import itertools
-import tokenize
 from apted import APTED, Config
-from io import StringIO
-import pygments
 
 from web.models import User, Result
-from web.winnowing import winnowing
+from web.tokens import get_tokens
+from web.trees import ensure_parsed, get_tree, EXACT, UNIFYING, IGNORING
+from web.winnowing import winnowing_tokens
+from web.highlight import render
 
 
 class Node:
@@ -26,204 +24,190 @@ class CustomConfig(Config):
         return [x for x in node.children if x]
 
 
-class Plagiarism:
-    """Receives two result ids and compute all plagiarism related specs."""
+def edit_distance(s1, s2, max_distance=None):
+    """Apply levenshtein distance to determine the edit distance between two comment strings.
 
-    def __init__(self, r1, r2):
-        self.r1 = r1
-        self.r2 = r2
+    Uses Myers' bit-parallel algorithm: a column of the DP table is kept as bit vectors of its
+    vertical differences in python integers, one bit per character of the shorter string. Stops
+    early once the distance can't be at most 'max_distance' anymore and returns the lower bound
+    reached at that point, which is larger than 'max_distance'.
+    """
+    # The shorter string is the pattern encoded in bits.
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+    if not s1:
+        return len(s2)
 
-        self.result_1 = Result.query.filter_by(id=r1).first()
-        self.result_2 = Result.query.filter_by(id=r2).first()
+    # Positions of every character in the pattern.
+    peq = {}
+    for i, c in enumerate(s1):
+        peq[c] = peq.get(c, 0) | (1 << i)
 
-        try:
-            self.tree_1 = ast.parse(self.result_1.content)
-            self.tree_2 = ast.parse(self.result_2.content)
-        except Exception as e:
-            self.tree_1 = None
-            self.tree_2 = None
+    mask = (1 << len(s1)) - 1
+    last = 1 << (len(s1) - 1)
+    pv, mv, score = mask, 0, len(s1)
 
-    #########################
-    # Plagiarism Algorithms #
-    #########################
+    for j, c in enumerate(s2):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
 
-    def exact_match(self, node1, node2):
-        """Exact match algorithm between two pieces of code."""
-
-        if type(node1) is not type(node2):
-            return False
-        if isinstance(node1, ast.AST):
-            for k, v in vars(node1).items():
-                # Skip unrelated information
-                if k in ('lineno', 'col_offset', 'ctx', 'end_col_offset', 'end_lineno'):
-                    continue
-                # Recursively check for child nodes
-                if not self.exact_match(v, getattr(node2, k)):
-                    return False
-
-            return True
-        elif isinstance(node1, list):
-            return all(itertools.starmap(self.exact_match, zip(node1, node2)))
-        else:
-            return node1 == node2
-
-    def unifying_ast_match(self, node1, node2):
-        """Unifying ast match detecting naive variable renaming."""
-
-        mapping = {}
-
-        def match(node1, node2):
-            if type(node1) is not type(node2):
-                return False
-            if isinstance(node1, ast.AST):
-                if isinstance(node1, ast.Expr):
-                    return True
-
-                for k, v in vars(node1).items():
-                    if k in ('lineno', 'col_offset', 'ctx', 'end_col_offset', 'end_lineno'):
-                        continue
-
-                    # Skip id and name of variables.
-                    if k == 'id' or k == 'arg':
-                        if v not in mapping:
-                            mapping[v] = getattr(node2, k)
-                        elif mapping[v] != getattr(node2, k):
-                            return False
-                    elif not self.unifying_ast_match(v, getattr(node2, k)):
-                        return False
-
-                return True
-            elif isinstance(node1, list):
-                if len(node1) != len(node2):
-                    return False
-                return all(itertools.starmap(self.unifying_ast_match, zip(node1, node2)))
-            else:
-                return node1 == node2
-
-        return match(node1, node2)
-
-    def ast_match_ignoring_variables(self, node1, node2):
-        """AST matching algorithm completely ignoring variables."""
-
-        if type(node1) is not type(node2):
-            return False
-        if isinstance(node1, ast.AST):
-            for k, v in vars(node1).items():
-                if k in ('lineno', 'col_offset', 'ctx', 'id', 'arg', 'name', 'args', 'end_col_offset', 'end_lineno'):
-                    continue
-                elif not self.ast_match_ignoring_variables(v, getattr(node2, k)):
-                    return False
-
-            return True
-        elif isinstance(node1, list):
-            return all(itertools.starmap(self.ast_match_ignoring_variables, zip(node1, node2)))
-        else:
-            return node1 == node2
-
-    def edit_distance(self, s1, s2):
-        """Apply levenshtein distance to determine the edit distance between two comment strings."""
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
 
-        # Initialize dp
-        dp = [[0] * (len(s2) + 1) for _ in range(len(s1) + 1)]
-
-        for i in range(len(dp)):
-            for j in range(len(dp[0])):
-                if i == 0 and j == 0:
-                    continue
-                elif i == 0:
-                    dp[i][j] = dp[i][j - 1] + 1
-                elif j == 0:
-                    dp[i][j] = dp[i - 1][j] + 1
-                else:
-                    if s1[i - 1] == s2[j - 1]:
-                        dp[i][j] = dp[i - 1][j - 1]
-                    else:
-                        dp[i][j] = min(dp[i - 1][j - 1], dp[i][j - 1], dp[i - 1][j]) + 1
-
-        return dp[-1][-1]
-
-    def tree_distance(self):
-        """Get edit distance between two AST trees using APTED algorithm."""
-        if not self.tree_1 or not self.tree_2:
-            return 0
+        # The first row of the table increases by one with every character.
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
 
-        r1, r2 = self.copy_tree(self.tree_1), self.copy_tree(self.tree_2)
-        apted = APTED(r1, r2, CustomConfig())
+        # The distance decreases by at most one per remaining character.
+        if max_distance is not None and score - (len(s2) - j - 1) > max_distance:
+            return score - (len(s2) - j - 1)
 
-        return 1 - apted.compute_edit_distance() / max(self.get_tree_size(r1), self.get_tree_size(r2))
+    return score
 
-    def comment_edit_distance(self):
-        """Apply string edit distance algorithm on the comment section of the source code."""
-        comments = ["", ""]
 
-        tokens_1 = tokenize.generate_tokens(StringIO(self.result_1.content).readline)  # Convert code into tokens
-        for token in tokens_1:
-            if token.exact_type in (3, 60):  # Comment - type 3 and string - type 6
-                comments[0] += self.preprocess(token.string)
+def copy_tree(labelled):
+    """Build the tree compared by APTED from a labelled tree, see trees.label_tree."""
+    root = Node(labelled[0])
+    stack = [(root, labelled[1])]
+
+    while stack:
+        parent, children = stack.pop()
+        for label, grandchildren in children:
+            node = Node(label)
+            parent.children.append(node)
+            stack.append((node, grandchildren))
+
+    return root
+
+
+def get_tree_size(root):
+    """Get size of a tree."""
+    size, stack = 0, [root]
+
+    while stack:
+        size += 1
+        stack.extend(stack.pop().children)
+
+    return size
+
+
+def get_label_histogram(labelled):
+    """Count the nodes of a labelled tree by label."""
+    histogram, stack = collections.Counter(), [labelled]
+
+    while stack:
+        label, children = stack.pop()
+        histogram[label] += 1
+        stack.extend(children)
+
+    return histogram
+
+
+def tree_similarity(tree_1, tree_2, threshold=0.0):
+    """Get the similarity of two labelled trees from their edit distance, using APTED algorithm.
+
+    APTED only runs on pairs which may be at least 'threshold' similar. For the others, the upper
+    bound of their similarity is returned, which is below 'threshold'.
+    """
+    histogram_1, histogram_2 = get_label_histogram(tree_1), get_label_histogram(tree_2)
+    size_1, size_2 = sum(histogram_1.values()), sum(histogram_2.values())
 
-        tokens_2 = tokenize.generate_tokens(StringIO(self.result_2.content).readline)
-        for token in tokens_2:
-            if token.exact_type in (3, 60):
-                comments[1] += self.preprocess(token.string)
+    # At least the difference of sizes has to be inserted or deleted.
+    if min(size_1, size_2) / max(size_1, size_2) < threshold:
+        return min(size_1, size_2) / max(size_1, size_2)
 
-        d = self.edit_distance(comments[0], comments[1])
-        mx_len = len(max(comments[0], comments[1], key=len))
+    # Every node without a node of the same label left in the other tree costs at least one edit.
+    bound = sum((histogram_1 & histogram_2).values()) / max(size_1, size_2)
+    if bound < threshold:
+        return bound
 
-        if mx_len == 0:
-            return 0.0
+    apted = APTED(copy_tree(tree_1), copy_tree(tree_2), CustomConfig())
 
-        return 1 - d / mx_len
+    return 1 - apted.compute_edit_distance() / max(size_1, size_2)
 
-    #####################
-    # Utility Functions #
-    #####################
 
-    def preprocess(self, s):
-        """Process the string to clean common characters in comments."""
-        return s.replace(' ', '').replace('\n', '').replace('#', '').replace('\"', '')
+def comment_similarity(comments_1, comments_2, threshold=0.0):
+    """Get the similarity of two comment strings from their edit distance.
 
-    def copy_tree(self, node, dummy=None):
-        t = type(node).__name__
+    The distance stops being computed once the similarity falls below 'threshold', an upper bound
+    of the similarity below 'threshold' is returned then.
+    """
+    mx_len = len(max(comments_1, comments_2, key=len))
 
-        if 'name' in node._fields:
-            t += ':' + node.name
-        elif 'id' in node._fields:
-            t += ':' + node.id
+    if mx_len == 0:
+        return 0.0
 
-        curr = Node(t)
-        if dummy is not None:
-            dummy.children.append(curr)
+    # Rounded first so that e.g. (1 - 0.9) * 100 allows a distance of 10 and not 9.
+    d = edit_distance(comments_1, comments_2, max_distance=int(round((1 - threshold) * mx_len, 9)))
+    return 1 - d / mx_len
 
-        for k, v in vars(node).items():
-            if isinstance(v, list):
-                for p in v:
-                    if isinstance(p, ast.AST):
-                        self.copy_tree(p, curr)
-            elif isinstance(v, ast.AST):
-                self.copy_tree(v, curr)
 
-        return curr
+class Plagiarism:
+    """Receives two results (or their ids) and compute all plagiarism related specs."""
+
+    def __init__(self, r1, r2):
+        # Results already loaded in the database session are reused instead of being queried again.
+        self.result_1 = r1 if isinstance(r1, Result) else Result.query.get(r1)
+        self.result_2 = r2 if isinstance(r2, Result) else Result.query.get(r2)
 
-    def get_tree_size(self, root):
-        """Get size of a tree."""
-        return 1 + sum(self.get_tree_size(node) for node in root.children)
+        self.r1 = self.result_1.id
+        self.r2 = self.result_2.id
+
+        ensure_parsed([self.result_1, self.result_2])
+        self.parsable = self.result_1.ast_exact_hash is not None and self.result_2.ast_exact_hash is not None
+
+    #########################
+    # Plagiarism Algorithms #
+    #########################
+
+    def ast_match(self, view):
+        """Match the ASTs of the two results under a view, see trees.canonical_form.
+
+        Views are EXACT (positions apart), UNIFYING (detecting naive variable renaming) and IGNORING
+        (completely ignoring variables).
+        """
+        return self.parsable and getattr(self.result_1, view) == getattr(self.result_2, view)
+
+    def edit_distance(self, s1, s2, max_distance=None):
+        """Apply levenshtein distance to determine the edit distance between two comment strings."""
+        return edit_distance(s1, s2, max_distance)
+
+    def tree_distance(self, threshold=0.0):
+        """Get edit distance between two AST trees using APTED algorithm, see tree_similarity."""
+        if not self.parsable:
+            return 0
+
+        return tree_similarity(get_tree(self.result_1), get_tree(self.result_2), threshold)
+
+    def comment_edit_distance(self, threshold=0.0):
+        """Apply string edit distance algorithm on the comment section of the source code."""
+        return comment_similarity(get_tokens(self.result_1)['comments'], get_tokens(self.result_2)['comments'],
+                                  threshold)
 
     def compile_plagarism_report_two(self):
         """Compare two specific files for plagiarism."""
-        if not self.tree_1 or not self.tree_2:
+        if not self.parsable:
             return []
 
         comparison = []
-        comparison.append(self.exact_match(self.tree_1, self.tree_2))
-        comparison.append(self.unifying_ast_match(self.tree_1, self.tree_2))
-        comparison.append(self.ast_match_ignoring_variables(self.tree_1, self.tree_2))
+        comparison.append(self.ast_match(EXACT))
+        comparison.append(self.ast_match(UNIFYING))
+        comparison.append(self.ast_match(IGNORING))
         comparison.append(self.comment_edit_distance())
 
         return comparison
 
     def winnowing_wrapper(self):
         """AST matching algorithm completely Ignore variable with line highlighting."""
-        f1, f2, _, _ = winnowing(self.result_1.content, self.result_2.content)
+        tokens_1, tokens_2 = get_tokens(self.result_1), get_tokens(self.result_2)
+        f1, f2, _, _ = winnowing_tokens(tokens_1['tokens'], tokens_1['lines'], tokens_2['tokens'], tokens_2['lines'])
         return f1, f2
 
     def highlight_diff(self):
@@ -233,25 +217,13 @@ class Plagiarism:
 
         # Wrapper for difference highlight style.
         def code_wrapper(code, diff_line):
-            prefix = '<div class="codehilite"><pre>'
-            suffix = '</pre></div>\n'
-
-            # Pygments automatically removes tabs so convert them to spaces here
-            code = code.replace('\t', '    ')
-
-            formatter = pygments.formatters.HtmlFormatter(style="emacs", cssclass="codehilite")
-            css_string = "<style>" + formatter.get_style_defs() + ".diff_plus { background-color: rgba(0, 255, 0, 0.3) }</style>" + prefix
-            res = [css_string]
-
-            for line in code.split('\n'):
-                res.append(pygments.highlight(line, pygments.lexers.PythonLexer(), formatter)[len(prefix):-len(suffix)])
-
+            marks = []
             for start, end in diff_line:
-                for lin_num in range(start - 1, end):
+                for lin_num in range(start, end + 1):
                     # Highlight overlaps in green background
-                    res[lin_num + 1] = '<div class={}>{}</div>'.format('diff_plus', res[lin_num + 1])
+                    marks.append((lin_num, '<div class=diff_plus>', '</div>'))
 
-            return ''.join(res) + suffix
+            return render(code, tuple(marks), ".diff_plus { background-color: rgba(0, 255, 0, 0.3) }")
 
         parsed1 = code_wrapper(self.result_1.content, f1)
         parsed2 = code_wrapper(self.result_2.content, f2)
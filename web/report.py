@@ -0,0 +1,242 @@
+"""Session-wide plagiarism report, comparing every unordered pair of results once over a process pool.
+
+Computed comparisons are written through to the Plagiarism table and served from it afterwards, they
+are deleted along with their results.
+"""
+
+import logging
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from sqlalchemy.exc import IntegrityError
+
+from web import app, db
+from web.models import Result, Plagiarism
+from web.tokens import get_tokens
+from web.trees import ensure_parsed, get_tree, EXACT, UNIFYING, IGNORING, AST_VERSION
+from web.sketches import candidate_results
+from web.plagiarism import tree_similarity, comment_similarity
+
+logger = logging.getLogger(__name__)
+
+# Below this number of pairs the report is computed in the request process, a pool isn't worth it.
+MIN_PARALLEL_PAIRS = 64
+
+# Version of the stored comparisons, bump it whenever 'compare_pair' gives other metrics (including
+# through trees.AST_VERSION or tokens.TOKENS_VERSION) so they are computed again.
+PLAGIARISM_VERSION = 1
+
+# Candidates found in the sketch index and compared exactly for each nearest result asked for.
+CANDIDATES_PER_NEIGHBOUR = 4
+
+# Compared results and threshold of the report, set in each process of the pool when it starts.
+_compared = []
+_threshold = 0.0
+
+# Processes of the pool are forked from a server process, which imports the app once and runs no other
+# thread, instead of from the request process whose background threads may hold locks.
+_pool_context = multiprocessing.get_context('forkserver')
+_pool_context.set_forkserver_preload(['web.report'])
+
+# Thread comparing newly graded results in the background, and the latest result waiting to be compared
+# for each (session id, user id), replaced when the student submits again before it runs.
+_background_executor = ThreadPoolExecutor(max_workers=1)
+_scheduled = {}
+_scheduled_lock = threading.Lock()
+
+
+def describe(result):
+    """Gather everything needed to compare a result, so the comparison doesn't touch the database."""
+    return {
+        'views': [getattr(result, view) for view in (EXACT, UNIFYING, IGNORING)],
+        'tree': get_tree(result),
+        'comments': get_tokens(result)['comments']
+    }
+
+
+def compare_pair(compared_1, compared_2, threshold=0.0):
+    """Compute all the symmetric plagiarism metrics of two described results.
+
+    Similarities below 'threshold' are upper bounds, see plagiarism.tree_similarity and comment_similarity.
+    """
+    parsable = compared_1['tree'] is not None and compared_2['tree'] is not None
+    matches = [parsable and view_1 == view_2 for view_1, view_2 in zip(compared_1['views'], compared_2['views'])]
+
+    return {
+        'similarity': round(tree_similarity(compared_1['tree'], compared_2['tree'], threshold), 3) if parsable else 0,
+        'exact_match': matches[0],
+        'unifying_ast_match': matches[1],
+        'ast_match_ignoring_variables': matches[2],
+        'comment_edit_distance': round(comment_similarity(compared_1['comments'], compared_2['comments'], threshold), 3)
+    }
+
+
+def _start_process(compared, threshold):
+    """Keep the compared results in a process of the pool, they are pickled to it once when it starts."""
+    global _compared, _threshold
+    _compared, _threshold = compared, threshold
+
+
+def _compare_indices(pair):
+    """Compare two results of the report by their index, in a process of the pool."""
+    i, j = pair
+    return compare_pair(_compared[i], _compared[j], _threshold)
+
+
+def stored_metrics(row):
+    """Get the metrics of a stored comparison, in the format of 'compare_pair'."""
+    return {
+        'similarity': row.similarity,
+        'exact_match': row.exact_match,
+        'unifying_ast_match': row.unifying_ast,
+        'ast_match_ignoring_variables': row.ignore_variables,
+        'comment_edit_distance': row.comment_similarity
+    }
+
+
+def store_metrics(row, metrics, threshold):
+    """Write the metrics computed with a threshold into a stored comparison."""
+    row.similarity = metrics['similarity']
+    row.exact_match = metrics['exact_match']
+    row.unifying_ast = metrics['unifying_ast_match']
+    row.ignore_variables = metrics['ast_match_ignoring_variables']
+    row.comment_similarity = metrics['comment_edit_distance']
+    row.threshold = threshold
+    row.version = PLAGIARISM_VERSION
+
+
+def compare_results(results, pairs, threshold=0.0, processes=None):
+    """Compare pairs of results, given by their indices in 'results', reusing the stored comparisons.
+
+    A comparison stored with a lower threshold is at least as exact, so it is reused as well. The
+    missing ones are computed on all cores for large numbers of pairs and stored.
+    Returns {(result id 1, result id 2): metrics} with the ids in the same order as in 'pairs'.
+    """
+    ids = [result.id for result in results]
+    stored = {(row.first_result_id, row.second_result_id): row for row in Plagiarism.query.filter(
+        Plagiarism.first_result_id.in_(ids), Plagiarism.second_result_id.in_(ids)).all()}
+
+    report = {}
+    missing = []
+
+    for i, j in pairs:
+        row = stored.get(tuple(sorted((ids[i], ids[j]))))
+        if row is not None and row.version == PLAGIARISM_VERSION and row.threshold <= threshold:
+            report[(i, j)] = stored_metrics(row)
+        else:
+            missing.append((i, j))
+
+    if not missing:
+        return {(ids[i], ids[j]): report[(i, j)] for i, j in pairs}
+
+    # Only the results of the missing pairs are described, the others keep None.
+    needed = sorted({i for pair in missing for i in pair})
+    ensure_parsed([results[i] for i in needed])
+    compared = [None] * len(results)
+    for i in needed:
+        compared[i] = describe(results[i])
+
+    processes = processes or app.config['PLAGIARISM_PROCESSES']
+
+    if processes == 1 or len(missing) < MIN_PARALLEL_PAIRS:
+        metrics = [compare_pair(compared[i], compared[j], threshold) for i, j in missing]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, mp_context=_pool_context,
+                                 initializer=_start_process, initargs=(compared, threshold)) as executor:
+            metrics = list(executor.map(_compare_indices, missing,
+                                        chunksize=max(1, len(missing) // (processes * 4))))
+
+    for (i, j), m in zip(missing, metrics):
+        report[(i, j)] = m
+        first, second = sorted((ids[i], ids[j]))
+
+        row = stored.get((first, second))
+        if row is None:
+            row = stored[(first, second)] = Plagiarism(first_result_id=first, second_result_id=second)
+            db.session.add(row)
+
+        store_metrics(row, m, threshold)
+
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same pairs have been compared concurrently.
+        db.session.rollback()
+
+    return {(ids[i], ids[j]): report[(i, j)] for i, j in pairs}
+
+
+def session_report(results, threshold=0.0, processes=None):
+    """Compare every unordered pair of results once, see compare_results.
+
+    Returns {(result id 1, result id 2): metrics} with the ids in the same order as in 'results'.
+    """
+    return compare_results(results, list(itertools.combinations(range(len(results)), 2)), threshold, processes)
+
+
+def nearest_results(result, k, threshold=None):
+    """Find the 'k' results of other users in the session with the most similar AST to a result.
+
+    Candidates sharing bands of its sketch are taken from the index and compared exactly, so only the
+    similarities of at least 'threshold' (TREE_SIMILARITY_THRESHOLD by default) are kept.
+    Returns a list of (similarity, result) in decreasing order of similarity.
+    """
+    threshold = app.config['TREE_SIMILARITY_THRESHOLD'] if threshold is None else threshold
+
+    # Results parsed by an older version may be missing from the index.
+    ensure_parsed([result] + Result.query.filter(Result.session_id == result.session_id, db.or_(
+        Result.ast_version.is_(None), Result.ast_version != AST_VERSION)).all())
+
+    ids = [result_id for result_id, _ in candidate_results(result, k * CANDIDATES_PER_NEIGHBOUR)]
+    candidates = Result.query.filter(Result.id.in_(ids)).order_by(Result.id).all()
+    report = compare_results([result] + candidates, [(0, i) for i in range(1, len(candidates) + 1)], threshold)
+
+    neighbours = [(report[(result.id, candidate.id)]['similarity'], candidate) for candidate in candidates]
+    neighbours = [(similarity, candidate) for similarity, candidate in neighbours if similarity >= threshold]
+    return sorted(neighbours, key=lambda x: x[0], reverse=True)[:k]
+
+
+def compare_latest(result):
+    """Compare a result against the latest passing result of every other student of its session."""
+    latest = db.session.query(db.func.max(Result.id)) \
+        .filter(Result.session_id == result.session_id, Result.success.is_(True), Result.user_id != result.user_id) \
+        .group_by(Result.user_id)
+    others = Result.query.filter(Result.id.in_(latest)).order_by(Result.id).all()
+
+    # Comparisons in the background stay in this process, they mustn't take the cores grading submissions.
+    return compare_results([result] + others, [(0, i) for i in range(1, len(others) + 1)],
+                           app.config['TREE_SIMILARITY_THRESHOLD'], processes=1)
+
+
+def _compare_scheduled(key):
+    """Compare the latest result scheduled for a (session id, user id), in the background thread."""
+    with _scheduled_lock:
+        result_id = _scheduled.pop(key)
+
+    with app.app_context():
+        try:
+            result = Result.query.get(result_id)
+            if result is not None:
+                compare_latest(result)
+        except Exception:
+            logger.exception(f"Failed to compare result {result_id}")
+            db.session.rollback()
+
+
+def schedule_comparisons(result):
+    """Compare a newly graded passing result in the background, so the session report is served from
+    the stored comparisons.
+
+    A result replaces the one of the same student still waiting to be compared.
+    """
+    if not app.config['PLAGIARISM_PRECOMPUTE'] or not result.success:
+        return
+
+    key = (result.session_id, result.user_id)
+    with _scheduled_lock:
+        waiting = key in _scheduled
+        _scheduled[key] = result.id
+
+    if not waiting:
+        _background_executor.submit(_compare_scheduled, key)
@@ -0,0 +1,167 @@
+"""Long-lived pool of pre-warmed sandbox processes for running user submitted code."""
+
+import os
+import queue
+import threading
+import inspect
+import contextlib
+import multiprocess
+
+# Marker sent by a worker after the last item of a streamed task.
+END_OF_STREAM = '__end_of_stream__'
+
+
+class SandboxTimeout(Exception):
+    """Raised when a sandbox worker does not answer within the given time limit."""
+    pass
+
+
+def _serve(conn):
+    """Main loop of a sandbox worker process.
+
+    The heavy dependencies are imported once when the worker starts so that every submission
+    leasing the worker afterwards skips the import cost.
+    """
+    import numpy  # noqa
+    import RestrictedPython  # noqa
+    import restricted_guard  # noqa
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+
+        # A None task is the signal for shutting down the worker.
+        if task is None:
+            break
+
+        func, args = task
+        result = func(*args)
+
+        # Generators are streamed back item by item, followed by the end of stream marker.
+        if inspect.isgenerator(result):
+            for item in result:
+                _send(conn, item)
+            conn.send(END_OF_STREAM)
+        else:
+            _send(conn, result)
+
+
+def _send(conn, item):
+    try:
+        conn.send(item)
+    except Exception as e:
+        # The returned value could not be pickled back to the parent process. Keep any trailing
+        # metadata of the outcome (e.g. timings).
+        metadata = item[2:] if isinstance(item, tuple) else ()
+        conn.send((1, f"Failed to return result: {e}") + metadata)
+
+
+class SandboxWorker(object):
+    """A single sandbox process connected to the application through a pipe."""
+
+    def __init__(self):
+        self._start()
+
+    def _start(self):
+        self.conn, child_conn = multiprocess.Pipe()
+        self.process = multiprocess.Process(target=_serve, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stream(self, func, args, timeout):
+        """Run the generator function func(*args) inside the worker and yield its items as they arrive.
+
+        The time limit applies to each item separately. The worker is killed on timeout since its state
+        can no longer be trusted, call 'recycle' to get a fresh process before running anything else on it.
+        """
+        if not self.is_alive():
+            self.recycle()
+
+        self.conn.send((func, args))
+
+        while True:
+            if not self.conn.poll(timeout):
+                self.terminate()
+                raise SandboxTimeout()
+
+            item = self._recv()
+            if isinstance(item, str) and item == END_OF_STREAM:
+                return
+            yield item
+
+    def _recv(self):
+        try:
+            return self.conn.recv()
+        except EOFError:
+            # The worker died while running the task (e.g. user code calling os._exit).
+            self.terminate()
+            raise SandboxTimeout()
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+    def recycle(self):
+        """Replace a dead or stuck worker process with a fresh one."""
+        self.terminate()
+        self._start()
+
+
+class SandboxPool(object):
+    """App-wide pool of sandbox workers.
+
+    Workers are spawned lazily on first use and handed out through 'lease'. A worker killed during
+    its lease (e.g. after a timeout) is recycled individually instead of restarting the whole pool.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or multiprocess.cpu_count()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        """Spawn the workers for the current process.
+
+        Checking the pid makes sure that forked web server processes (e.g. gunicorn workers) build
+        their own pool instead of sharing the pipes inherited from the parent.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._idle = queue.Queue()
+            for _ in range(self.size):
+                self._idle.put(SandboxWorker())
+            self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def lease(self):
+        """Borrow a worker from the pool, blocking until one becomes available.
+
+        The worker is recycled when it died, or when the lease ends with an exception.
+        """
+        self._ensure_started()
+        worker = self._idle.get()
+
+        try:
+            yield worker
+        except BaseException:
+            # Items of an interrupted task may be left unread in the pipe, they mustn't be read as the
+            # outcome of the next one.
+            worker.recycle()
+            raise
+        else:
+            if not worker.is_alive():
+                worker.recycle()
+        finally:
+            self._idle.put(worker)
+
+
+pool = SandboxPool(int(os.getenv('SANDBOX_POOL_SIZE', 0)) or None)
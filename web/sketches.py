@@ -0,0 +1,114 @@
+"""MinHash sketches of ASTs, estimating the similarity of two results in a few microseconds.
+
+A tree is described by the set of its shingles: the (grandparent, parent, node) paths of node types
+and the (parent, node, next sibling) triples. The fraction of equal minimums between two sketches
+estimates the Jaccard similarity of those sets. Node names are left out so renaming variables
+doesn't change the sketch.
+
+Sketches are split into bands indexed per session (locality-sensitive hashing): two results sharing a
+band are likely similar, so candidates are found by looking up the bands of a result only.
+"""
+
+import hashlib
+import numpy as np
+
+from web import db
+from web.models import Result, SketchBand
+from web.winnowing import mix64
+from web.subtrees import to_signed
+
+# Number of hash functions in a sketch, the error of the estimate is about 1 / sqrt(NUM_HASHES).
+NUM_HASHES = 64
+
+# Each hash function is the mixing of the shingle hash xor-ed with one of these seeds.
+SEEDS = np.random.RandomState(20201018).randint(0, 2 ** 63, size=NUM_HASHES, dtype=np.int64).astype(np.uint64)
+
+# Number of bands of a sketch. Results share a band with a probability of 1 - (1 - s^4)^16 for a similarity
+# s of 4 hashes per band, which is about 0.06 at s = 0.25, 0.65 at s = 0.5 and 0.99 at s = 0.75.
+NUM_BANDS = 16
+
+
+def tree_shingles(labelled):
+    """Get the shingles of a labelled tree (see trees.label_tree) as 64 bit hashes."""
+    shingles = set()
+    stack = [(labelled, '', '')]
+
+    while stack:
+        (label, children), parent, grandparent = stack.pop()
+        node = label.split(':')[0]
+        shingles.add(f'{grandparent}/{parent}/{node}')
+
+        types = [child[0].split(':')[0] for child in children]
+        for i, child in enumerate(children):
+            shingles.add(f'{node}>{types[i]}>{types[i + 1] if i + 1 < len(types) else ""}')
+            stack.append((child, node, parent))
+
+    return np.array([int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+                     for s in shingles], dtype=np.uint64)
+
+
+def sketch_tree(labelled):
+    """Compute the MinHash sketch of a labelled tree, serialized to bytes."""
+    shingles = tree_shingles(labelled)
+    return mix64(shingles[:, None] ^ SEEDS[None, :]).min(axis=0).tobytes()
+
+
+def load_sketch(sketch):
+    """Deserialize a sketch computed by 'sketch_tree'."""
+    return np.frombuffer(sketch, dtype=np.uint64)
+
+
+def estimate_similarity(sketch_1, sketch_2):
+    """Estimate the similarity of two trees from their deserialized sketches."""
+    return float(np.count_nonzero(sketch_1 == sketch_2)) / NUM_HASHES
+
+
+def rank_by_sketch(result, candidates):
+    """Rank candidate results by the estimated similarity of their AST to the one of a result.
+
+    Results which can't be parsed have no sketch and are ranked last with a similarity of 0.
+    Returns a list of (estimated similarity, candidate) in decreasing order of similarity.
+    """
+    if not result.ast_sketch:
+        return [(0.0, candidate) for candidate in candidates]
+
+    sketch = load_sketch(result.ast_sketch)
+    ranked = [(estimate_similarity(sketch, load_sketch(candidate.ast_sketch)) if candidate.ast_sketch else 0.0,
+               candidate) for candidate in candidates]
+
+    return sorted(ranked, key=lambda x: x[0], reverse=True)
+
+
+def sketch_bands(sketch):
+    """Hash each band of a serialized sketch into the bucket indexing it."""
+    rows = NUM_HASHES // NUM_BANDS
+    return [to_signed(hashlib.blake2b(sketch[i * rows * 8:(i + 1) * rows * 8], digest_size=8).digest())
+            for i in range(NUM_BANDS)]
+
+
+def index_sketch(result, sketch):
+    """Store the band buckets of the sketch of a result in the index, replacing outdated ones."""
+    SketchBand.query.filter_by(result_id=result.id).delete(synchronize_session=False)
+
+    if sketch is None:
+        return
+
+    db.session.bulk_insert_mappings(SketchBand, [
+        {'band': band, 'bucket': bucket, 'result_id': result.id, 'session_id': result.session_id}
+        for band, bucket in enumerate(sketch_bands(sketch))
+    ])
+
+
+def candidate_results(result, limit):
+    """Find the results of other users in the session sharing a band with a result.
+
+    Only the buckets of the result are looked up in the index, whatever the size of the session.
+    Returns up to 'limit' (result id, number of shared bands), most shared bands first.
+    """
+    own = db.aliased(SketchBand)
+
+    return db.session.query(SketchBand.result_id, db.func.count(SketchBand.id).label('shared')) \
+        .join(own, db.and_(own.result_id == result.id, own.band == SketchBand.band, own.bucket == SketchBand.bucket)) \
+        .join(Result, Result.id == SketchBand.result_id) \
+        .filter(SketchBand.session_id == result.session_id, Result.user_id != result.user_id) \
+        .group_by(SketchBand.result_id).order_by(db.desc('shared'), SketchBand.result_id).limit(limit).all()
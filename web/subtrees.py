@@ -0,0 +1,145 @@
+"""Session-wide index of Merkle hashes of the functions, classes and statement blocks of results.
+
+Every node is hashed from the hashes of its children, so all the subtrees of a result are hashed in
+a single pass. A function copied into another submission has the same hash wherever it is found,
+and the identifier-normalized hash still matches when its variables have been renamed.
+"""
+
+import ast
+import hashlib
+import itertools
+import collections
+
+from web import db
+from web.models import Subtree
+from web.fingerprints import max_document_frequency
+
+# Subtrees with fewer nodes are too common to tell anything (e.g. 'if x: return y').
+MIN_SUBTREE_SIZE = 12
+
+# Nodes whose subtrees are indexed.
+INDEXED_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.For, ast.AsyncFor, ast.While,
+                 ast.If, ast.With, ast.AsyncWith, ast.Try)
+
+# Fields left out of the normalized hashes.
+IDENTIFIER_FIELDS = ('id', 'arg', 'name', 'asname')
+
+
+def to_signed(digest):
+    """Convert an 8 bytes digest into a number fitting in a BigInteger column."""
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def hash_subtrees(tree):
+    """Hash every subtree of an AST with and without its identifiers, positions and ctx apart.
+
+    Returns a list of (exact hash, normalized hash, node, size) for the indexed subtrees.
+    """
+    subtrees = []
+
+    def visit(node):
+        exact = hashlib.blake2b(type(node).__name__.encode('utf-8'), digest_size=8)
+        normalized = exact.copy()
+        size = 1
+
+        for k, v in ast.iter_fields(node):
+            if k == 'ctx':
+                continue
+
+            exact.update(b'\0' + k.encode('utf-8'))
+            normalized.update(b'\0' + k.encode('utf-8'))
+
+            for child in (v if isinstance(v, list) else [v]):
+                if isinstance(child, ast.AST):
+                    child_exact, child_normalized, child_size = visit(child)
+                    exact.update(child_exact)
+                    normalized.update(child_normalized)
+                    size += child_size
+                else:
+                    value = repr(child).encode('utf-8')
+                    exact.update(b'\1' + value)
+                    normalized.update(b'\1' + (b'' if k in IDENTIFIER_FIELDS else value))
+
+        exact, normalized = exact.digest(), normalized.digest()
+        if isinstance(node, INDEXED_NODES) and size >= MIN_SUBTREE_SIZE:
+            subtrees.append((to_signed(exact), to_signed(normalized), node, size))
+
+        return exact, normalized, size
+
+    visit(tree)
+    return subtrees
+
+
+def index_subtrees(result, tree):
+    """Store the subtree hashes of a parsed result in the index, replacing outdated ones."""
+    Subtree.query.filter_by(result_id=result.id).delete(synchronize_session=False)
+
+    if tree is None:
+        return
+
+    db.session.bulk_insert_mappings(Subtree, [
+        {
+            'exact_hash': exact,
+            'normalized_hash': normalized,
+            'label': type(node).__name__ + (':' + node.name if hasattr(node, 'name') else ''),
+            'lineno': node.lineno,
+            'end_lineno': getattr(node, 'end_lineno', None),
+            'size': size,
+            'result_id': result.id,
+            'session_id': result.session_id
+        }
+        for exact, normalized, node, size in hash_subtrees(tree)
+    ])
+
+
+def match_subtrees(result, normalized=True):
+    """Find the subtrees of a result found in the other results of the session.
+
+    Returns {result id: [labels of the shared subtrees of the result]}.
+    """
+    from web.trees import ensure_parsed
+    ensure_parsed([result])
+
+    column = Subtree.normalized_hash if normalized else Subtree.exact_hash
+    own = db.aliased(Subtree)
+
+    rows = db.session.query(Subtree.result_id, own.label) \
+        .join(own, db.and_(own.result_id == result.id, getattr(own, column.key) == column)) \
+        .filter(Subtree.session_id == result.session_id, Subtree.result_id != result.id) \
+        .distinct().order_by(Subtree.result_id, own.lineno).all()
+
+    matches = collections.defaultdict(list)
+    for result_id, label in rows:
+        matches[result_id].append(label)
+
+    return dict(matches)
+
+
+def session_shared_subtrees(session_id, results, normalized=True):
+    """Count the subtrees shared by every pair of results in a single pass over the index.
+
+    Returns {(result id 1, result id 2): number of shared subtrees} with result id 1 < result id 2.
+    Subtrees found in most of the results are left out as boilerplate.
+    """
+    from web.trees import ensure_parsed
+    ensure_parsed(results)
+    result_ids = [result.id for result in results]
+
+    column = Subtree.normalized_hash if normalized else Subtree.exact_hash
+    rows = db.session.query(column, Subtree.result_id) \
+        .filter(Subtree.session_id == session_id, Subtree.result_id.in_(result_ids)) \
+        .distinct().order_by(column).all()
+
+    max_frequency = max_document_frequency(len(result_ids))
+    shared = collections.Counter()
+
+    for _, posting in itertools.groupby(rows, key=lambda row: row[0]):
+        posting = sorted(result_id for _, result_id in posting)
+
+        if len(posting) > max_frequency:
+            continue
+
+        for pair in itertools.combinations(posting, 2):
+            shared[pair] += 1
+
+    return dict(shared)
@@ -0,0 +1,84 @@
+"""Process-wide cache of compiled session test suites."""
+
+import copy
+import pickle
+import hashlib
+import threading
+import collections
+
+# Maximum number of test suites kept in memory at once.
+MAX_CACHED_SUITES = 64
+
+_suites = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def get_digest(test_code):
+    """Hash the test code of a session into the cache key."""
+    return hashlib.sha256(test_code.encode('utf-8')).hexdigest()
+
+
+def cache_suite(test_code, suite):
+    """Store an already built TestCases instance for the test code."""
+    with _lock:
+        _suites[get_digest(test_code)] = suite
+        _suites.move_to_end(get_digest(test_code))
+
+        # Evict the least recently used suites.
+        while len(_suites) > MAX_CACHED_SUITES:
+            _suites.popitem(last=False)
+
+
+def dump_fixtures(suite):
+    """Serialize the parameters and answers of a built suite (numpy arrays included).
+
+    Returns None when they can't be serialized (e.g. instances of classes defined in the test code),
+    in which case the suite keeps being generated by its initializer.
+    """
+    try:
+        return pickle.dumps({'parameters': suite.parameters, 'answers': suite.answers}, protocol=5)
+    except Exception:
+        return None
+
+
+def load_suite(test_code, load_fixtures=None):
+    """Get the TestCases instance of the test code, compiling it only on cache misses.
+
+    'load_fixtures' optionally returns the fixtures stored by 'dump_fixtures'. When available the
+    suite is built from them instead of generating the parameters and answers again. It is only
+    called on cache misses. The returned instance is shared and its parameters / answers must be
+    treated as read-only.
+    """
+    digest = get_digest(test_code)
+
+    with _lock:
+        if digest in _suites:
+            _suites.move_to_end(digest)
+            return _suites[digest]
+
+    d = {}
+    exec(test_code, d)
+
+    fixtures = load_fixtures() if load_fixtures else None
+    if fixtures:
+        fixtures = pickle.loads(fixtures)
+        suite = d['TestCases'].from_fixtures('DUMMY', fixtures['parameters'], fixtures['answers'])
+    else:
+        suite = d['TestCases']('DUMMY')
+
+    cache_suite(test_code, suite)
+    return suite
+
+
+def get_test_cases(test_code, func, load_fixtures=None):
+    """Get a TestCases instance ready for testing the user submitted code 'func'."""
+    suite = copy.copy(load_suite(test_code, load_fixtures))
+    suite.func = func
+    suite.timing = {}
+    return suite
+
+
+def invalidate_suite(test_code):
+    """Drop the cached suite of test code that has been replaced."""
+    with _lock:
+        _suites.pop(get_digest(test_code), None)
@@ -0,0 +1,60 @@
+"""Token streams of results, computed once and stored with the result for the plagiarism detectors."""
+
+import json
+import tokenize
+from io import StringIO
+
+from web import db
+from web.winnowing import token_text
+
+# Bump whenever the tokens generated for the same code change, so stored ones get rebuilt.
+TOKENS_VERSION = 1
+
+
+def preprocess(s):
+    """Process the string to clean common characters in comments."""
+    return s.replace(' ', '').replace('\n', '').replace('#', '').replace('\"', '')
+
+
+def comment_text(code):
+    """Concatenate the comments and strings of the code, cleaned up for comparing them."""
+    comments = ""
+
+    try:
+        for token in tokenize.generate_tokens(StringIO(code).readline):
+            if token.exact_type in (tokenize.COMMENT, tokenize.STRING):
+                comments += preprocess(token.string)
+    except (tokenize.TokenError, SyntaxError):
+        # Keep the comments found before the code stops being valid python.
+        pass
+
+    return comments
+
+
+def tokenize_code(code):
+    """Tokenize the code for every token based detector.
+
+    Returns {'tokens': [(token, line number, offset in the corpus), ...], 'lines': number of lines,
+    'comments': comment text}, see winnowing.token_text and comment_text.
+    """
+    tokens, lines = token_text(code)
+    return {'tokens': tokens, 'lines': lines, 'comments': comment_text(code)}
+
+
+def store_tokens(result):
+    """Tokenize a result and store the tokens with it."""
+    tokens = tokenize_code(result.content)
+    result.tokens = json.dumps(dict(tokens, version=TOKENS_VERSION))
+    return tokens
+
+
+def get_tokens(result):
+    """Get the tokens of a result, tokenizing it only if they are missing or outdated."""
+    if result.tokens:
+        tokens = json.loads(result.tokens)
+        if tokens.pop('version', None) == TOKENS_VERSION:
+            return tokens
+
+    tokens = store_tokens(result)
+    db.session.commit()
+    return tokens
@@ -0,0 +1,167 @@
+"""Normalized ASTs of results, parsed once and stored with hashes of their canonical forms.
+
+Two results match under a view of their ASTs when the hashes of that view are the same, so matching
+them is a comparison of two columns, and finding all the copies in a session is a GROUP BY.
+"""
+
+import ast
+import json
+import hashlib
+
+from web import db
+from web.models import Result
+from web.subtrees import index_subtrees
+from web.sketches import sketch_tree, index_sketch
+
+# Bump whenever the canonical forms, labels, sketches, sketch bands or subtree hashes generated for the
+# same code change.
+AST_VERSION = 4
+
+# Views of the AST, as the name of the Result column holding their hash.
+EXACT = 'ast_exact_hash'
+UNIFYING = 'ast_unifying_hash'
+IGNORING = 'ast_ignoring_hash'
+
+# Fields left out of each view. Positions aren't fields so they are always left out.
+SKIPPED_FIELDS = {
+    EXACT: ('ctx',),
+    UNIFYING: ('ctx',),
+    IGNORING: ('ctx', 'id', 'arg', 'name', 'args'),
+}
+
+
+def canonical_form(tree, view):
+    """Serialize an AST with its positions stripped, as seen by one of the views.
+
+    The unifying view renames variables and arguments in order of first appearance, so code only
+    differing by a consistent renaming has the same form, and skips expression statements such as
+    docstrings.
+    """
+    names = {}
+    parts = []
+
+    def dump(node):
+        if isinstance(node, ast.AST):
+            parts.append(type(node).__name__ + '(')
+
+            if view == UNIFYING and isinstance(node, ast.Expr):
+                parts.append(')')
+                return
+
+            for k, v in ast.iter_fields(node):
+                if k in SKIPPED_FIELDS[view]:
+                    continue
+
+                parts.append(k + '=')
+                if view == UNIFYING and k in ('id', 'arg'):
+                    parts.append(names.setdefault(v, f'v{len(names)}'))
+                else:
+                    dump(v)
+                parts.append(',')
+
+            parts.append(')')
+        elif isinstance(node, list):
+            parts.append('[')
+            for v in node:
+                dump(v)
+                parts.append(',')
+            parts.append(']')
+        else:
+            parts.append(repr(node))
+
+    dump(tree)
+    return ''.join(parts)
+
+
+def label_tree(tree):
+    """Convert an AST into nested [label, [children]] lists, labelled by node type and name."""
+
+    def convert(node):
+        label = type(node).__name__
+
+        if 'name' in node._fields:
+            label += ':' + str(node.name)
+        elif 'id' in node._fields:
+            label += ':' + str(node.id)
+
+        children = []
+        for _, v in ast.iter_fields(node):
+            for child in (v if isinstance(v, list) else [v]):
+                if isinstance(child, ast.AST):
+                    children.append(convert(child))
+
+        return [label, children]
+
+    return convert(tree)
+
+
+def store_ast(result):
+    """Parse a result and store its labelled tree, its sketch and the hashes of every view with it.
+
+    The hashes of its subtrees and the bands of its sketch are indexed too. Everything is left empty
+    for code which can't be parsed.
+    """
+    try:
+        tree = ast.parse(result.content)
+    except (SyntaxError, ValueError, RecursionError):
+        tree = None
+
+    try:
+        _store_tree(result, tree)
+    except RecursionError:
+        # The walks of the tree recurse once per level, valid code can be nested deeper than the limit.
+        _store_tree(result, None)
+
+
+def _store_tree(result, tree):
+    """Store the labelled tree, the sketch and the hashes of a parsed result, empty if tree is None."""
+    for view in SKIPPED_FIELDS:
+        digest = hashlib.sha256(canonical_form(tree, view).encode('utf-8')).hexdigest() if tree else None
+        setattr(result, view, digest)
+
+    labelled = label_tree(tree) if tree else None
+    result.ast_tree = json.dumps(labelled) if tree else None
+    result.ast_sketch = sketch_tree(labelled) if tree else None
+    index_subtrees(result, tree)
+    index_sketch(result, result.ast_sketch)
+    result.ast_version = AST_VERSION
+
+
+def ensure_parsed(results):
+    """Parse the results never parsed or parsed by an older version."""
+    outdated = [result for result in results if result.ast_version != AST_VERSION]
+
+    for result in outdated:
+        store_ast(result)
+
+    if outdated:
+        db.session.commit()
+
+
+def get_tree(result):
+    """Get the labelled tree of a result, or None if it can't be parsed."""
+    ensure_parsed([result])
+    return json.loads(result.ast_tree) if result.ast_tree else None
+
+
+def find_copies(session_id, view=EXACT, results=None):
+    """Group the results of a session having the same AST under a view.
+
+    'results' optionally restricts the search to some results of the session. Returns a list of
+    groups of at least two result ids.
+    """
+    query = Result.query.filter_by(session_id=session_id)
+    if results is not None:
+        query = query.filter(Result.id.in_([result.id for result in results]))
+
+    ensure_parsed(query.filter(db.or_(Result.ast_version.is_(None), Result.ast_version != AST_VERSION)).all())
+
+    column = getattr(Result, view)
+    copied = query.with_entities(column).filter(column.isnot(None)) \
+        .group_by(column).having(db.func.count(Result.id) > 1)
+
+    groups = {}
+    for digest, result_id in query.with_entities(column, Result.id).filter(column.in_(copied)).order_by(Result.id):
+        groups.setdefault(digest, []).append(result_id)
+
+    return list(groups.values())
@@ -1,19 +1,36 @@
 from flask_login import current_user
 from flask import redirect, url_for, flash, request, jsonify
 
+import io
 import os
 import re
+import ast
+import html
+import tokenize
+import hashlib
+import threading
 import collections
 import nbformat
 import requests
-import pygments
+import pycodestyle
+import pyflakes.checker
 import json
 from functools import wraps
 from nbconvert import PythonExporter
-from subprocess import check_output, STDOUT, CalledProcessError
+from sqlalchemy.exc import IntegrityError
+from flake8.defaults import NOQA_INLINE_REGEXP
+from flake8.plugins.pyflakes import FLAKE8_PYFLAKES_CODES
 
-from web import app
-from web.models import User, Result
+from web import app, db
+from web.models import User, Result, StyleCache
+from web.suites import cache_suite
+from web.highlight import render
+
+# Maximum number of style check reports kept in memory at once.
+MAX_CACHED_STYLE_CHECKS = 1024
+
+_style_cache = collections.OrderedDict()
+_style_lock = threading.Lock()
 
 
 def get_google_provider_cfg():
@@ -40,28 +57,137 @@ def convert_timedelta_to_string(timed):
         return "Just now"
 
 
+class _StyleReport(pycodestyle.BaseReport):
+    """Collect pycodestyle warnings instead of printing them."""
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.warnings = []
+
+    def error(self, line_number, offset, text, check):
+        code = super().error(line_number, offset, text, check)
+        if code:
+            self.warnings.append((line_number, offset + 1, code, text[5:]))
+        return code
+
+
+class _PyflakesReporter(object):
+    """Collect pyflakes messages with the codes flake8 gives them."""
+
+    def __init__(self):
+        self.warnings = []
+
+    def flake(self, message):
+        code = FLAKE8_PYFLAKES_CODES.get(type(message).__name__, 'F')
+        self.warnings.append((message.lineno, message.col + 1, code, message.message % message.message_args))
+
+
+def check_style(to_test, rules_to_ignore):
+    """Run the checks behind flake8 (pycodestyle and pyflakes) on code held in memory.
+
+    Returns a list of (line number, column, rule code, warning text) sorted by position.
+    """
+    lines = to_test.splitlines(True)
+
+    style_guide = pycodestyle.StyleGuide(ignore=rules_to_ignore, quiet=True)
+    report = _StyleReport(style_guide.options)
+    pycodestyle.Checker(lines=lines, options=style_guide.options, report=report).check_all()
+    warnings = report.warnings
+
+    tree = None
+    try:
+        collections.deque(tokenize.generate_tokens(io.StringIO(to_test).readline), maxlen=0)
+    except (SyntaxError, tokenize.TokenError) as e:
+        # Same as flake8, code that can't be tokenized is reported on the first line and isn't parsed.
+        # Pycodestyle reports it as E901 then still checks the unfinished logical line, flake8 doesn't.
+        codes = [w[2] for w in warnings]
+        if "E901" in codes:
+            warnings = warnings[:codes.index("E901")]
+        if "E902" not in rules_to_ignore:
+            warnings.append((1, 1, "E902", f"{type(e).__name__}: {e.args[0]}"))
+    else:
+        try:
+            tree = ast.parse(to_test)
+        except SyntaxError as e:
+            # Same as flake8, stop checking at the syntax error and report it instead.
+            warnings = [w for w in warnings if w[0] < (e.lineno or 1)]
+            if "E999" not in rules_to_ignore:
+                warnings.append((e.lineno or 1, max(e.offset or 1, 1), "E999", f"SyntaxError: {e.msg}"))
+
+    if tree is not None:
+        reporter = _PyflakesReporter()
+        try:
+            for message in pyflakes.checker.Checker(tree, filename="<inline code>").messages:
+                reporter.flake(message)
+        finally:
+            # Pyflakes links every node to its parent, including the context and operator nodes
+            # that CPython shares between all parsed trees. Unlink them so other trees stay acyclic.
+            for node in ast.walk(tree):
+                node.__dict__.pop('_pyflakes_parent', None)
+                node.__dict__.pop('_pyflakes_depth', None)
+        warnings += [w for w in reporter.warnings if w[2] not in rules_to_ignore]
+
+    def is_inline_ignored(warning):
+        """Check for '# noqa' comments the same way flake8 does."""
+        line = lines[warning[0] - 1] if 0 < warning[0] <= len(lines) else ''
+        matched = NOQA_INLINE_REGEXP.search(line)
+        if not matched:
+            return False
+        if not matched.group('codes'):
+            return True
+        return warning[2].startswith(tuple(re.split(r'[,\s]+', matched.group('codes').strip())))
+
+    return sorted((w for w in warnings if not is_inline_ignored(w)), key=lambda w: (w[0], w[1]))
+
+
 def flake8_test(to_test, filename):
-    """Python flake8 style test."""
+    """Python flake8 style test.
+
+    The checks run in-process on the code in memory. Reports are cached by the SHA-256 of the code
+    and the ignored rules, first in memory and then in the database, since identical resubmissions
+    are common.
+    """
     if filename.split(".")[1] == "ipynb":
         filename = filename.split(".")[0] + ".py"
 
-    path = os.path.join(app.config["FILE_UPLOADS"], filename)
-    with open(path, 'w') as file:
-        file.write(to_test)
-
-    style_check = "Passed Python Style Check."
     rules_to_ignore = ["W191"]
+    digest = hashlib.sha256('\0'.join([to_test] + rules_to_ignore).encode('utf-8')).hexdigest()
 
-    try:
-        check_output(
-            ["flake8", f"--ignore={','.join(rules_to_ignore)}", path], stderr=STDOUT)
-    except CalledProcessError as e:
-        style_check = e.output.decode("utf-8")
-    except Exception as e:
-        style_check = f"Failed to load flake8 module {e}"
+    with _style_lock:
+        report = _style_cache.get(digest)
+        if report is not None:
+            _style_cache.move_to_end(digest)
+
+    if report is None:
+        cached = StyleCache.query.filter_by(digest=digest).first()
+
+        if cached:
+            report = cached.report
+        else:
+            try:
+                warnings = check_style(to_test, rules_to_ignore)
+            except Exception as e:
+                return f"Failed to load flake8 module {e}"
+
+            report = ''.join(f"{line}:{col}: {code} {text}\n" for line, col, code, text in warnings)
+
+            try:
+                db.session.add(StyleCache(digest=digest, report=report))
+                db.session.commit()
+            except IntegrityError:
+                # The same code has been checked concurrently.
+                db.session.rollback()
+
+        with _style_lock:
+            _style_cache[digest] = report
+            while len(_style_cache) > MAX_CACHED_STYLE_CHECKS:
+                _style_cache.popitem(last=False)
+
+    if not report:
+        return "Passed Python Style Check."
 
-    os.remove(path)
-    return style_check
+    # Default flake8 formatting: '%(path)s:%(row)d:%(col)d: %(code)s %(text)s'.
+    return ''.join(f"{filename}:{line}\n" for line in report.splitlines())
 
 
 def flake8_parser(flake8_output):
@@ -171,16 +297,7 @@ def convert_jupyter(file, filename):
 
 def highlight_python(code):
     """Highlight python code to html."""
-
-    code = code.replace('\t', '    ')
-    formatter = pygments.formatters.HtmlFormatter(
-        style="emacs", cssclass="codehilite")
-    css_string = "<style>" + formatter.get_style_defs() + "</style>"
-
-    for line in code.split('\n'):
-        css_string += pygments.highlight(line,
-                                         pygments.lexers.PythonLexer(), formatter)
-    return css_string
+    return render(code)
 
 
 def highlight_python_with_flake8(code, err):
@@ -191,30 +308,12 @@ def highlight_python_with_flake8(code, err):
     for lineno, _, _, error_message in err:
         errors[int(lineno)].append(error_message)
 
-    code = code.replace('\t', '    ').split('\n')
-    formatter = pygments.formatters.HtmlFormatter(
-        style="emacs", cssclass="codehilite")
-    css_string = "<style>" + formatter.get_style_defs() + "</style>"
-
-    prefix = '<div class="codehilite"><pre>'
-    suffix = '</pre></div>\n'
-
-    css_string += prefix
-
-    for lineno in range(len(code)):
-        line = code[lineno]
+    marks = []
+    for lineno in sorted(errors):
+        all_errors = html.escape('\n'.join(errors[lineno]))
+        marks.append((lineno, f"<a href=\"#\" title=\"{all_errors}\" data-toggle=\"tooltip\" data-placement=\"top\" style=\"background-color:#ffcccc;\">", "</a>"))
 
-        highlighted = pygments.highlight(line, pygments.lexers.PythonLexer(), formatter)[
-            len(prefix):-len(suffix)]
-
-        if lineno + 1 in errors:
-            all_errors = '\n'.join(errors[lineno + 1])
-            highlighted = f"<a href=\"#\" title=\"{all_errors}\" data-toggle=\"tooltip\" data-placement=\"top\" style=\"background-color:#ffcccc;\">{highlighted}</a>"
-
-        css_string += highlighted
-
-    css_string += suffix
-    return css_string
+    return render(code, tuple(marks))
 
 
 def compile_results(res):
@@ -237,7 +336,11 @@ def compile_results(res):
 
 
 def check_session_file_parsable(uploaded):
-    """Validate if a user submitted session file is parsable."""
+    """Validate if a user submitted session file is parsable.
+
+    A parsable session file is kept in the test suite cache so its answers are not generated again
+    for the first submission.
+    """
     d = {}
     exec(uploaded, d)
 
@@ -264,4 +367,5 @@ def check_session_file_parsable(uploaded):
                 if len(parameters[k][i]) != len(parameters[k][i + 1]):
                     return False, f"The number of parameters for question {k} is inconsistent."
 
+    cache_suite(uploaded, dummy)
     return True, ""
@@ -1,7 +1,14 @@
 from pygments.lexers import PythonLexer
 from pygments.token import Name, Literal, Text, Comment
-import hashlib
+import bisect
 import collections
+import numpy as np
+
+# Bump whenever the fingerprints generated for the same text change, so stored ones get rebuilt.
+WINNOWING_VERSION = 2
+
+# Base of the polynomial rolling hash of k grams, odd so that it's invertible modulo 2^64.
+HASH_BASE = np.uint64(1000003)
 
 
 def token_text(text):
@@ -28,56 +35,82 @@ def token_text(text):
     return results, line_num
 
 
-def hash_into_num(text):
-    """Hash text into numbers using SHA-1"""
-    hashval = hashlib.sha1(text.encode('utf-8')).hexdigest()[-4:]
-    return int(hashval, 16)
+def mix64(hashes):
+    """Mix an array of 64 bit hashes with the MurmurHash3 finalizer, so every bit depends on all bits."""
+    hashes = hashes ^ (hashes >> np.uint64(33))
+    hashes *= np.uint64(0xff51afd7ed558ccd)
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= np.uint64(0xc4ceb9fe1a85ec53)
+    hashes ^= hashes >> np.uint64(33)
+    return hashes
 
 
-def kgrams(text, k):
-    """Pack text into k grams."""
-    return [text[i:i + k] for i in range(len(text) - k)]
+def hash_kgrams(text, k):
+    """Hash every k gram of a text into 32 bit numbers.
 
+    The k grams are hashed as polynomials of their characters modulo 2^64, all at once with numpy,
+    then mixed so that every bit of the hash depends on every character. The hash of the k gram
+    starting at offset i is at index i.
+    """
+    chars = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    num_kgrams = len(chars) - k
+    if num_kgrams <= 0:
+        return []
 
-def generate_fingerprints(arr, window_size=4):
-    """Generate fingerprints for a list of hashed values."""
-    queue = collections.deque(arr[:window_size])
+    hashes = np.zeros(num_kgrams, dtype=np.uint64)
+    for i in range(k):
+        hashes = hashes * HASH_BASE + chars[i:i + num_kgrams]
 
-    def get_min_ind(a):
-        return len(a) - 1 - a[::-1].index(min(a))
+    return (mix64(hashes) >> np.uint64(32)).astype(np.uint32).tolist()
 
-    m_ind = get_min_ind(list(queue))
-    fingerprints = [(min(queue), m_ind)]
-    visited = set([m_ind])
 
-    for i in range(len(arr) - window_size):
-        queue.popleft()
-        queue.append(arr[i + window_size])
+def generate_fingerprints(arr, window_size=4):
+    """Generate fingerprints for a list of hashed values.
+
+    The minimum of every window of hashes is selected, the rightmost one on ties, and recorded once
+    as (hash, index). Indices of the candidate minimums are kept in a deque of increasing hashes so
+    each hash is pushed and popped at most once.
+    """
+    candidates = collections.deque()
+    fingerprints = []
+
+    for i, h in enumerate(arr):
+        # Hashes larger or equal to the new one can't be the rightmost minimum of any window anymore.
+        while candidates and arr[candidates[-1]] >= h:
+            candidates.pop()
+        candidates.append(i)
+
+        # Wait for the first window to fill up, unless there are fewer hashes than a window.
+        if i < window_size - 1 and i < len(arr) - 1:
+            continue
+
+        if candidates[0] <= i - window_size:
+            candidates.popleft()
 
-        min_ind = i + get_min_ind(list(queue)) + 1
-        if min_ind not in visited:
-            fingerprints.append((min(queue), min_ind))
-            visited.add(min_ind)
+        if not fingerprints or fingerprints[-1][1] != candidates[0]:
+            fingerprints.append((arr[candidates[0]], candidates[0]))
 
     return fingerprints
 
 
-def backtrack_line_num(ind, token_map, k):
-    """Backtrack for the matching line number."""
-    i_range = (ind, ind + k)
+def token_offsets(token_map):
+    """Get the offsets of the tokens in the corpus, in increasing order, for binary searching."""
+    return [loc for _, _, loc in token_map]
+
+
+def backtrack_line_num(ind, token_map, offsets, k):
+    """Backtrack for the matching line numbers of the k-gram starting at corpus offset 'ind'."""
     min_line = max_line = -1
 
-    for i in range(len(token_map)):
-        _, l, loc = token_map[i]
+    # First token starting at or after the k-gram, the k-gram starts within the token before it.
+    start = bisect.bisect_left(offsets, ind)
+    if start < len(offsets):
+        min_line = token_map[start][1] if offsets[start] == ind else token_map[start - 1][1]
 
-        if loc >= i_range[0] and min_line < 0:
-            if loc == i_range[0]:
-                min_line = l
-            else:
-                min_line = token_map[i - 1][1]
-        elif loc >= i_range[1] and max_line < 0:
-            max_line = token_map[i - 1][1]
-            break
+        # First token after the start one starting at or after the end of the k-gram.
+        end = max(bisect.bisect_left(offsets, ind + k), start + 1)
+        if end < len(offsets):
+            max_line = token_map[end - 1][1]
 
     return min_line + 1, max_line + 1
 
@@ -103,27 +136,48 @@ def merge_intervals(arr):
     return results
 
 
-def winnowing(f1, f2, k=20):
-    """Use winnowing algorithm to detect the approximity between two texts."""
+def fingerprint_tokens(tokens, k=20):
+    """Generate the winnowing fingerprints of tokenized text as a list of (hash, token offset)."""
+    return generate_fingerprints(hash_kgrams(''.join(t[0] for t in tokens), k))
 
-    tokens_1, file1_len = token_text(f1)
-    tokens_2, file2_len = token_text(f2)
 
-    corpus_1 = ''.join(t[0] for t in tokens_1)
-    corpus_2 = ''.join(t[0] for t in tokens_2)
+def fingerprint_text(text, k=20):
+    """Generate the winnowing fingerprints of a text as a list of (hash, token offset)."""
+    tokens, _ = token_text(text)
+    return fingerprint_tokens(tokens, k)
 
-    fingerprints_1 = generate_fingerprints(list(map(hash_into_num, kgrams(corpus_1, k))))
-    fingerprints_2 = generate_fingerprints(list(map(hash_into_num, kgrams(corpus_2, k))))
+
+def winnowing_tokens(tokens_1, file1_len, tokens_2, file2_len, k=20):
+    """Use winnowing algorithm to detect the approximity between two tokenized texts."""
+
+    fingerprints_1 = fingerprint_tokens(tokens_1, k)
+    fingerprints_2 = fingerprint_tokens(tokens_2, k)
+
+    offsets_1 = token_offsets(tokens_1)
+    offsets_2 = token_offsets(tokens_2)
+
+    # Join the fingerprints on their hash instead of comparing every pair of them.
+    positions_2 = collections.defaultdict(list)
+    for f2, j in fingerprints_2:
+        positions_2[f2].append(j)
 
     intervals_1, intervals_2 = [], []
 
     for f1, i in fingerprints_1:
-        for f2, j in fingerprints_2:
-            if f1 == f2:
-                intervals_1.append(backtrack_line_num(i, tokens_1, k))
-                intervals_2.append(backtrack_line_num(j, tokens_2, k))
+        for j in positions_2.get(f1, ()):
+            intervals_1.append(backtrack_line_num(i, tokens_1, offsets_1, k))
+            intervals_2.append(backtrack_line_num(j, tokens_2, offsets_2, k))
 
     i1 = merge_intervals(intervals_1)
     i2 = merge_intervals(intervals_2)
 
     return i1, i2, sum(b - a + 1 for a, b in i1) / file1_len, sum(b - a + 1 for a, b in i2) / file2_len
+
+
+def winnowing(f1, f2, k=20):
+    """Use winnowing algorithm to detect the approximity between two texts."""
+
+    tokens_1, file1_len = token_text(f1)
+    tokens_2, file2_len = token_text(f2)
+
+    return winnowing_tokens(tokens_1, file1_len, tokens_2, file2_len, k)